@@ -15,6 +15,7 @@ from app.config import get_settings
 from app.models.user import User
 from app.models.message import Message, Reaction
 from app.models.room import Room, room_members, room_invites
+from app.models.attachment import Attachment
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,45 @@
+"""Hot query indexes
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a7d2b84
+Create Date: 2026-10-17 14:03:27.551940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d6f1a93'
+down_revision: Union[str, None] = '3f1c9a7d2b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # room_members had no key at all, so collapse duplicate memberships before making it unique
+    conn = op.get_bind()
+    duplicates = conn.execute(sa.text(
+        "SELECT room_id, user_id FROM room_members "
+        "GROUP BY room_id, user_id HAVING COUNT(*) > 1"
+    )).fetchall()
+    for room_id, user_id in duplicates:
+        params = {"room_id": room_id, "user_id": user_id}
+        conn.execute(sa.text(
+            "DELETE FROM room_members WHERE room_id = :room_id AND user_id = :user_id"
+        ), params)
+        conn.execute(sa.text(
+            "INSERT INTO room_members (room_id, user_id) VALUES (:room_id, :user_id)"
+        ), params)
+
+    op.create_index('ux_room_members_room_user', 'room_members', ['room_id', 'user_id'], unique=True)
+    op.create_index('ix_room_invites_user_status', 'room_invites', ['user_id', 'status'], unique=False)
+    op.create_index('ix_reactions_message_user_emoji', 'reactions', ['message_id', 'user_id', 'emoji'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reactions_message_user_emoji', table_name='reactions')
+    op.drop_index('ix_room_invites_user_status', table_name='room_invites')
+    op.drop_index('ux_room_members_room_user', table_name='room_members')
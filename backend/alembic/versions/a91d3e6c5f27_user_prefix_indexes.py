@@ -0,0 +1,28 @@
+"""User prefix indexes
+
+Revision ID: a91d3e6c5f27
+Revises: f2b7c91e4d08
+Create Date: 2026-10-17 21:58:03.114702
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91d3e6c5f27'
+down_revision: Union[str, None] = 'f2b7c91e4d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=False)
+    op.create_index('ix_users_full_name_lower', 'users', [sa.text('lower(full_name)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_full_name_lower', table_name='users')
+    op.drop_index('ix_users_username_lower', table_name='users')
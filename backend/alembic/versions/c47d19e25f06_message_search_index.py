@@ -0,0 +1,39 @@
+"""Message search index
+
+Revision ID: c47d19e25f06
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-17 16:41:09.207315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.search import create_search_index, search_supported
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47d19e25f06'
+down_revision: Union[str, None] = '8b2e4d6f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FTS5 is SQLite-only; search returns 501 on other databases
+    bind = op.get_bind()
+    if not search_supported(bind):
+        return
+    # Same (IF NOT EXISTS) DDL the app runs at startup, so a database it already
+    # indexed upgrades cleanly; the rebuild indexes the existing history
+    create_search_index(bind, rebuild=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_insert")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
@@ -0,0 +1,48 @@
+"""Attachment store
+
+Revision ID: d5a80c3e71b2
+Revises: c47d19e25f06
+Create Date: 2026-10-17 19:26:54.803166
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a80c3e71b2'
+down_revision: Union[str, None] = 'c47d19e25f06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('attachments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('storage_path', sa.String(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sha256')
+    )
+    op.create_index(op.f('ix_attachments_id'), 'attachments', ['id'], unique=False)
+    # Existing uploads keep their uuid file names and no attachment row
+    op.add_column('messages', sa.Column('attachment_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_messages_attachment_id'), 'messages', ['attachment_id'], unique=False)
+    # SQLite can only add the constraint by rebuilding messages (batch mode), which would
+    # also drop the search triggers on it
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_foreign_key('fk_messages_attachment_id_attachments', 'messages', 'attachments', ['attachment_id'], ['id'])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_messages_attachment_id_attachments', 'messages', type_='foreignkey')
+    op.drop_index(op.f('ix_messages_attachment_id'), table_name='messages')
+    op.drop_column('messages', 'attachment_id')
+    op.drop_index(op.f('ix_attachments_id'), table_name='attachments')
+    op.drop_table('attachments')
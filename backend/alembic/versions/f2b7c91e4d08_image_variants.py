@@ -0,0 +1,41 @@
+"""Image variants
+
+Revision ID: f2b7c91e4d08
+Revises: d5a80c3e71b2
+Create Date: 2026-10-17 20:41:12.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7c91e4d08'
+down_revision: Union[str, None] = 'd5a80c3e71b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing images keep only their original until re-uploaded
+    op.add_column('messages', sa.Column('thumbnail_url', sa.String(), nullable=True))
+    op.add_column('messages', sa.Column('thumbnail_width', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('thumbnail_height', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('preview_url', sa.String(), nullable=True))
+    op.add_column('messages', sa.Column('image_width', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('image_height', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('avatar_thumbnail_url', sa.String(length=255), nullable=True))
+    op.add_column('users', sa.Column('avatar_preview_url', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'avatar_preview_url')
+    op.drop_column('users', 'avatar_thumbnail_url')
+    op.drop_column('messages', 'image_height')
+    op.drop_column('messages', 'image_width')
+    op.drop_column('messages', 'preview_url')
+    op.drop_column('messages', 'thumbnail_height')
+    op.drop_column('messages', 'thumbnail_width')
+    op.drop_column('messages', 'thumbnail_url')
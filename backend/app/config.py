@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     app_name: str = "ChatFlow API"
@@ -7,8 +8,40 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 10080
     database_url: str
+    database_read_url: Optional[str] = None  # separate read-only engine for GET handlers (turns off ETags and the history cache)
+    db_pool_size: int = 10  # server databases only; SQLite keeps SQLAlchemy's defaults
+    db_max_overflow: int = 20
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    sqlite_journal_mode: str = "WAL"  # readers no longer block the writer (and vice versa)
+    sqlite_synchronous: str = "NORMAL"  # safe with WAL; fsync at checkpoints, not every commit
+    sqlite_busy_timeout_ms: int = 5000  # wait for the write lock instead of failing with "database is locked"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # negative = KiB, so ~64MB of page cache per connection
     upload_dir: str = "uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    auth_cache_size: int = 10000  # 0 disables the token -> identity cache
+    auth_cache_ttl_seconds: int = 60
+    bcrypt_rounds: int = 12  # changing this rehashes passwords on next login
+    password_hash_workers: int = 4
+    ws_send_queue_size: int = 256  # frames buffered per socket before it is dropped as a slow consumer
+    ws_backplane: str = "memory"  # "unix" to fan out across uvicorn workers on one host (presence stays per worker)
+    ws_backplane_socket: str = "/tmp/chatflow-backplane.sock"
+    typing_flush_interval_ms: int = 300  # typing lists are broadcast at most once per tick per room
+    typing_timeout_seconds: int = 6  # a typing flag without a refresh expires after this (the client re-sends every 3s)
+    presence_flush_interval_seconds: float = 2.0  # batch window for is_online/last_seen writes
+    message_group_commit: bool = False  # queue message inserts and commit them in batches
+    message_group_commit_window_ms: int = 5  # how long a batch waits for more rows
+    message_group_commit_max_rows: int = 200
+    history_cache_room_messages: int = 100  # latest messages kept in memory per room; 0 disables
+    history_cache_max_bytes: int = 64 * 1024 * 1024  # cold rooms are evicted past this (encoded size)
+    fast_json_responses: bool = True  # encode list endpoints with orjson instead of re-validating each row
+    thumbnail_workers: int = 2  # processes rendering image thumbnails/previews off the request path
+    thumbnail_size: int = 320  # bounding box of the inline thumbnail of an image message
+    preview_size: int = 1280  # bounding box of the WebP preview opened on click
+    avatar_thumbnail_size: int = 96  # square crop used in message lists and member pickers
+    avatar_preview_size: int = 512
+    thumbnail_max_pixels: int = 50_000_000  # larger images keep only their original
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,163 @@
+"""Content-addressed, deduplicated storage for message attachments.
+
+Files live under ``<upload_dir>/objects/<first two hex chars>/<sha256><ext>``
+and are shared by every message that uploads the same bytes. The
+``attachments`` row counts the referencing messages. When the last one is
+deleted, the row and the file go too. A URL's content never changes, so
+``/uploads/objects`` is served with a far-future immutable Cache-Control.
+
+Several workers can share the store: a file is only moved into place or
+unlinked under ``object_lock``, and unlinked only if no row points at it.
+"""
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.staticfiles import StaticFiles
+from ..config import get_settings
+from ..models.attachment import Attachment
+from .uploads import ReceivedUpload
+from .thumbnails import remove_variants
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # no cross-process lock (Windows): run a single worker there
+
+settings = get_settings()
+
+OBJECTS_DIR = "objects"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+OBJECT_LOCK_FILE = ".gc-lock"
+
+# Serializes "file exists <-> row exists" transitions so an upload can't
+# reuse a file that a concurrent delete is about to unlink
+store_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def object_lock():
+    """The cross-process side of ``store_lock``; take ``store_lock`` first.
+
+    Held around moving a new object into place and around the "no row left"
+    check and unlink, so another worker's delete can't remove a file this
+    one has just stored under the same path.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = Path(settings.upload_dir) / OBJECTS_DIR / OBJECT_LOCK_FILE
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        # Blocks while another worker holds it, so wait off the event loop
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def object_path(sha256: str, extension: str) -> str:
+    return f"{OBJECTS_DIR}/{sha256[:2]}/{sha256}{extension}"
+
+def attachment_url(attachment: Attachment) -> str:
+    return f"/uploads/{attachment.storage_path}"
+
+async def store_attachment(db: AsyncSession, upload: ReceivedUpload, extension: str) -> Attachment:
+    """Take one reference on the stored copy of ``upload``, storing it if it is new.
+
+    The reference is committed here, before the message row exists. If the
+    message insert then fails, the caller must hand it back with
+    ``release_attachment`` (see ``upload_file``).
+    """
+    async with store_lock:
+        for _ in range(2):
+            result = await db.execute(
+                update(Attachment)
+                .where(Attachment.sha256 == upload.sha256)
+                .values(ref_count=Attachment.ref_count + 1)
+            )
+            if result.rowcount:
+                await db.commit()
+                upload.discard()
+                return (await db.execute(
+                    select(Attachment).where(Attachment.sha256 == upload.sha256)
+                )).scalar_one()
+
+            storage_path = object_path(upload.sha256, extension)
+            destination = Path(settings.upload_dir) / storage_path
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            attachment = Attachment(
+                sha256=upload.sha256,
+                size=upload.size,
+                storage_path=storage_path,
+                ref_count=1
+            )
+            db.add(attachment)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another worker stored the same bytes first; take a reference on theirs
+                await db.rollback()
+                continue
+            async with object_lock():
+                upload.move_to(destination)
+            return attachment
+    upload.discard()
+    raise RuntimeError(f"Could not store attachment {upload.sha256}")
+
+async def release_attachment(db: AsyncSession, attachment_id: Optional[int]) -> Optional[str]:
+    """Drop one reference inside the caller's transaction.
+
+    Returns the storage path to collect once the caller has committed (see
+    ``collect_garbage``), or None while other messages still use it. Call
+    it, commit and collect while holding ``store_lock``.
+    """
+    if attachment_id is None:
+        return None
+    await db.execute(
+        update(Attachment)
+        .where(Attachment.id == attachment_id)
+        .values(ref_count=Attachment.ref_count - 1)
+    )
+    storage_path = (await db.execute(
+        select(Attachment.storage_path).where(Attachment.id == attachment_id)
+    )).scalar_one_or_none()
+    result = await db.execute(
+        delete(Attachment).where(Attachment.id == attachment_id, Attachment.ref_count <= 0)
+    )
+    if not result.rowcount or storage_path is None:
+        return None
+    return storage_path
+
+async def collect_garbage(db: AsyncSession, storage_path: Optional[str]):
+    """Unlink a released object, unless another worker has stored it again since."""
+    if storage_path is None:
+        return
+    async with object_lock():
+        path = Path(settings.upload_dir) / storage_path
+        # The file name is "<sha256><ext>", so this is a lookup on the unique sha256 index
+        stored_again = (await db.execute(
+            select(Attachment.id).where(
+                Attachment.sha256 == path.stem,
+                Attachment.storage_path == storage_path
+            )
+        )).first() is not None
+        await db.rollback()  # end the read transaction
+        if stored_again:
+            return
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        remove_variants(path)
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-addressed paths: cache forever."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
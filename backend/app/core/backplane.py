@@ -0,0 +1,228 @@
+"""Cross-worker fan-out for room broadcasts.
+
+With ``uvicorn --workers N`` every process has its own ConnectionManager, so
+a frame published on one worker has to be forwarded to sockets held by the
+others. ConnectionManager delivers locally and hands each room frame to a
+backplane:
+
+* ``Backplane`` (``ws_backplane = "memory"``): single process, nothing to forward.
+* ``UnixSocketBackplane`` (``ws_backplane = "unix"``): workers on one host
+  connect to a small broker over a Unix socket. The broker only forwards a
+  room's frames to workers that currently have a member of that room
+  subscribed. Whichever worker grabs the lock file hosts the broker; if it
+  exits, the others re-elect and resubscribe. Needs Unix sockets and
+  ``fcntl``, so it is not available on Windows.
+"""
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import os
+import orjson
+from ..config import Settings
+
+FrameHandler = Callable[[int, str, Optional[int]], Awaitable[None]]
+
+# A worker that can't keep up with the broker is disconnected and resubscribes
+BROKER_MAX_CLIENT_BUFFER = 8 * 1024 * 1024
+# Longest event line either end will read (StreamReader's default is 64 KiB). A
+# capped-length message frame, JSON-escaped twice, fits with plenty of room to
+# spare; anything longer is dropped at publish instead of breaking the connection
+MAX_EVENT_BYTES = 4 * 1024 * 1024
+RECONNECT_DELAY_SECONDS = 0.2
+
+class Backplane:
+    """In-process backplane: every subscriber lives in this worker."""
+
+    distributed = False
+
+    def __init__(self):
+        self.on_frame: Optional[FrameHandler] = None
+
+    async def start(self, on_frame: FrameHandler):
+        self.on_frame = on_frame
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, room_id: int):
+        pass
+
+    def unsubscribe(self, room_id: int):
+        pass
+
+    def publish(self, room_id: int, frame: str, exclude_user: Optional[int] = None):
+        pass
+
+class BackplaneBroker:
+    """Routes published room frames to the workers subscribed to that room."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.room_subscribers: Dict[int, Set[asyncio.StreamWriter]] = {}
+        self.workers: Set[asyncio.StreamWriter] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a dead broker; we hold the lock
+        self.server = await asyncio.start_unix_server(
+            self._handle_worker, path=self.socket_path, limit=MAX_EVENT_BYTES
+        )
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            # wait_closed() also waits for open connections (Python 3.12.1+), so drop them first
+            for writer in list(self.workers):
+                writer.close()
+            await self.server.wait_closed()
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        rooms: Set[int] = set()
+        self.workers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                event = orjson.loads(line)
+                op, room_id = event["op"], event["room"]
+                if op == "sub":
+                    rooms.add(room_id)
+                    self.room_subscribers.setdefault(room_id, set()).add(writer)
+                elif op == "unsub":
+                    rooms.discard(room_id)
+                    self._remove_subscriber(room_id, writer)
+                elif op == "pub":
+                    self._forward(room_id, line, sender=writer)
+        except (ConnectionError, ValueError, KeyError) as e:
+            print(f"Backplane broker dropped a worker: {e}")
+        finally:
+            for room_id in rooms:
+                self._remove_subscriber(room_id, writer)
+            self.workers.discard(writer)
+            writer.close()
+
+    def _forward(self, room_id: int, line: bytes, sender: asyncio.StreamWriter):
+        for writer in list(self.room_subscribers.get(room_id, ())):
+            if writer is sender:
+                continue
+            if writer.transport.get_write_buffer_size() > BROKER_MAX_CLIENT_BUFFER:
+                print("Backplane broker dropping a slow worker")
+                writer.close()
+                continue
+            writer.write(line)
+
+    def _remove_subscriber(self, room_id: int, writer: asyncio.StreamWriter):
+        subscribers = self.room_subscribers.get(room_id)
+        if subscribers is None:
+            return
+        subscribers.discard(writer)
+        if not subscribers:
+            del self.room_subscribers[room_id]
+
+class UnixSocketBackplane(Backplane):
+    """Backplane for several worker processes on one host, via a Unix socket broker.
+
+    Frames published while the broker is being re-elected are dropped, the
+    same as frames to a socket that was closed; clients resync on reconnect.
+    """
+
+    distributed = True
+
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self.rooms: Set[int] = set()
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.broker: Optional[BackplaneBroker] = None
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_frame: FrameHandler):
+        await super().start(on_frame)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        if self.broker is not None:
+            await self.broker.stop()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def subscribe(self, room_id: int):
+        self.rooms.add(room_id)
+        self._send({"op": "sub", "room": room_id})
+
+    def unsubscribe(self, room_id: int):
+        self.rooms.discard(room_id)
+        self._send({"op": "unsub", "room": room_id})
+
+    def publish(self, room_id: int, frame: str, exclude_user: Optional[int] = None):
+        self._send({"op": "pub", "room": room_id, "frame": frame, "exclude": exclude_user})
+
+    def _send(self, event: dict):
+        if self.writer is None or self.writer.is_closing():
+            return
+        line = orjson.dumps(event) + b"\n"
+        if len(line) > MAX_EVENT_BYTES:
+            print(f"Backplane dropping a {len(line)}-byte event for room {event['room']}")
+            return
+        self.writer.write(line)
+
+    async def _try_host_broker(self):
+        # The flock is released by the OS if this process dies, so a new broker can take over
+        if self.broker is not None:
+            return
+        import fcntl
+        lock_file = open(f"{self.socket_path}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return
+        self._lock_file = lock_file
+        self.broker = BackplaneBroker(self.socket_path)
+        await self.broker.start()
+        print(f"Backplane broker listening on {self.socket_path} (pid {os.getpid()})")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=MAX_EVENT_BYTES)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await self._try_host_broker()
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            self.writer = writer
+            for room_id in self.rooms:
+                self._send({"op": "sub", "room": room_id})
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    event = orjson.loads(line)
+                    await self.on_frame(event["room"], event["frame"], event.get("exclude"))
+            except (ConnectionError, ValueError, KeyError) as e:
+                print(f"Backplane connection lost: {e}")
+            finally:
+                self.writer = None
+                writer.close()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+def create_backplane(settings: Settings) -> Backplane:
+    if settings.ws_backplane == "unix":
+        try:
+            import fcntl  # noqa: F401
+        except ImportError:
+            fcntl = None
+        if fcntl is None or not hasattr(asyncio, "start_unix_server"):
+            raise RuntimeError('ws_backplane="unix" needs Unix sockets and fcntl; use "memory" on this platform')
+        return UnixSocketBackplane(settings.ws_backplane_socket)
+    if settings.ws_backplane != "memory":
+        raise ValueError(f"Unknown ws_backplane: {settings.ws_backplane}")
+    return Backplane()
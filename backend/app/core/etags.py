@@ -0,0 +1,68 @@
+from threading import Lock
+from typing import Dict, Hashable, Optional
+import secrets
+from fastapi import Request, Response
+from ..config import get_settings
+
+settings = get_settings()
+
+# Change keys behind the conditional GET endpoints
+ROOMS_KEY = "rooms"  # room list and memberships
+PROFILES_KEY = "profiles"  # user rows and the author fields embedded in history
+PRESENCE_KEY = "presence"  # is_online / last_seen
+
+def room_key(room_id: int) -> tuple:
+    return ("room", room_id)  # a room's messages and reactions
+
+class ChangeVersions:
+    """In-process change counters that back ETags on the hot GET endpoints.
+
+    Write paths bump a counter; a GET builds its ETag from the counters it
+    depends on, so If-None-Match is answered with 304 before any query runs.
+    Tags carry a per-process epoch, so a restart never reuses an old tag.
+    Counters only see this process's writes, so ETags are turned off when a
+    distributed backplane spreads writes across workers. They are also off
+    with a separate read database: a lagging replica could return pre-write
+    rows under a post-write tag, and the client would keep that stale copy.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.epoch = secrets.token_hex(4)
+        self._versions: Dict[Hashable, int] = {}
+        self._lock = Lock()
+
+    def bump(self, key: Hashable):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def etag(self, *keys: Hashable, vary: str = "") -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            counters = ".".join(str(self._versions.get(key, 0)) for key in keys)
+        return f'W/"{self.epoch}-{counters}{"-" + vary if vary else ""}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def conditional_response(request: Request, response: Response, etag: Optional[str]) -> Optional[Response]:
+    """A 304 if the client already has ``etag``; otherwise tag ``response`` and return None."""
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+change_versions = ChangeVersions(
+    enabled=settings.ws_backplane == "memory" and not settings.database_read_url
+)
@@ -0,0 +1,197 @@
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional
+from ..config import get_settings
+from ..utils.serialization import dumps
+
+settings = get_settings()
+
+class RoomHistory:
+    """The latest messages of one room, oldest first, as response dicts."""
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[dict] = deque(maxlen=max_messages)
+        self.sizes: Deque[int] = deque(maxlen=max_messages)  # encoded size of each message
+        self.bytes = 0
+        # True while the buffer holds the room's entire history, so short rooms serve any limit
+        self.complete = False
+
+    def append(self, message: dict):
+        if len(self.messages) == self.messages.maxlen:
+            self.bytes -= self.sizes[0]
+            self.complete = False
+        size = len(dumps(message))
+        self.messages.append(message)
+        self.sizes.append(size)
+        self.bytes += size
+
+    def find(self, message_id: int) -> int:
+        for index in range(len(self.messages) - 1, -1, -1):
+            if self.messages[index]["id"] == message_id:
+                return index
+        return -1
+
+    def resize(self, index: int):
+        size = len(dumps(self.messages[index]))
+        self.bytes += size - self.sizes[index]
+        self.sizes[index] = size
+
+class HistoryCache:
+    """Per-room ring buffers of recent history, for the latest-page request on room open.
+
+    Buffers are filled from the database on a miss and then kept current by
+    the message write paths (create, upload, delete, reactions). Cold rooms
+    are evicted LRU-first once the encoded size passes
+    ``history_cache_max_bytes``. The cache is per process, so it is turned
+    off when a distributed backplane spreads writes across workers. It is
+    also off with a separate read database, whose lag would let a fill
+    cache a page from before the latest writes.
+    """
+
+    def __init__(self, room_messages: int, max_bytes: int):
+        self.room_messages = room_messages
+        self.max_bytes = max_bytes
+        self.enabled = (
+            room_messages > 0 and max_bytes > 0
+            and settings.ws_backplane == "memory"
+            and not settings.database_read_url
+        )
+        self._rooms: "OrderedDict[int, RoomHistory]" = OrderedDict()
+        self._bytes = 0
+        # Bumped on every write so a fill that raced a write is discarded
+        self._versions: Dict[int, int] = {}
+        self._lock = Lock()
+
+    def version(self, room_id: int) -> int:
+        with self._lock:
+            return self._versions.get(room_id, 0)
+
+    def invalidate(self, room_id: int):
+        """Called by write paths before they commit.
+
+        A fill whose version was read before this call is discarded, even if
+        its query ran after the commit and already saw the new row.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+
+    def latest(self, room_id: int, limit: int) -> Optional[List[dict]]:
+        """The newest ``limit`` messages, oldest first, or None on a miss."""
+        if not self.enabled or limit > self.room_messages:
+            return None
+        with self._lock:
+            history = self._rooms.get(room_id)
+            if history is None:
+                return None
+            if limit > len(history.messages) and not history.complete:
+                return None
+            self._rooms.move_to_end(room_id)
+            page = list(history.messages)[-limit:] if limit else []
+            # Copies, since reactions keep changing while the response is encoded
+            return [dict(msg, reactions=list(msg["reactions"])) for msg in page]
+
+    def fill(self, room_id: int, messages: List[dict], complete: bool, version: int):
+        """Store a latest page read from the database at ``version``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._versions.get(room_id, 0) != version or room_id in self._rooms:
+                return
+            history = RoomHistory(self.room_messages)
+            for message in messages[-self.room_messages:]:
+                history.append(dict(message, reactions=list(message["reactions"])))
+            history.complete = complete and len(messages) <= self.room_messages
+            self._rooms[room_id] = history
+            self._bytes += history.bytes
+            self._evict()
+
+    def append(self, room_id: int, message: dict):
+        def append_message(history: RoomHistory):
+            # A fill that ran after the commit may already hold this message
+            if history.find(message["id"]) < 0:
+                history.append(dict(message, reactions=list(message["reactions"])))
+        self._update(room_id, append_message)
+
+    def remove(self, room_id: int, message_id: int):
+        def remove_message(history: RoomHistory):
+            index = history.find(message_id)
+            if index < 0:
+                return
+            history.bytes -= history.sizes[index]
+            del history.messages[index]
+            del history.sizes[index]
+        self._update(room_id, remove_message)
+
+    def add_reaction(self, room_id: int, message_id: int, reaction: dict):
+        def add(history: RoomHistory):
+            index = history.find(message_id)
+            if index < 0:
+                return
+            reactions = history.messages[index]["reactions"]
+            if any(r["id"] == reaction["id"] for r in reactions):
+                return
+            reactions.append(reaction)
+            history.resize(index)
+        self._update(room_id, add)
+
+    def remove_reaction(self, room_id: int, message_id: int, user_id: int, emoji: str):
+        def remove(history: RoomHistory):
+            index = history.find(message_id)
+            if index < 0:
+                return
+            message = history.messages[index]
+            message["reactions"] = [
+                r for r in message["reactions"]
+                if not (r["user_id"] == user_id and r["emoji"] == emoji)
+            ]
+            history.resize(index)
+        self._update(room_id, remove)
+
+    def update_message(self, room_id: int, message_id: int, **fields):
+        def update(history: RoomHistory):
+            index = history.find(message_id)
+            if index < 0:
+                return
+            history.messages[index].update(fields)
+            history.resize(index)
+        self._update(room_id, update)
+
+    def update_author(self, user_id: int, **fields):
+        # Cached messages carry the author's profile fields (e.g. avatar_url)
+        if not self.enabled:
+            return
+        with self._lock:
+            for history in self._rooms.values():
+                for index, message in enumerate(history.messages):
+                    if message["user_id"] == user_id:
+                        message.update(fields)
+                        history.resize(index)
+            self._bytes = sum(history.bytes for history in self._rooms.values())
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._bytes = 0
+
+    def _update(self, room_id: int, change):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+            history = self._rooms.get(room_id)
+            if history is None:
+                return
+            before = history.bytes
+            change(history)
+            self._bytes += history.bytes - before
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._rooms:
+            _, history = self._rooms.popitem(last=False)
+            self._bytes -= history.bytes
+
+history_cache = HistoryCache(settings.history_cache_room_messages, settings.history_cache_max_bytes)
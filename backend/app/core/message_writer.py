@@ -0,0 +1,103 @@
+from typing import List, Optional, Tuple
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models.message import Message
+
+settings = get_settings()
+
+PendingInsert = Tuple[Message, asyncio.Future]
+
+class MessageWriter:
+    """Optional write-behind group commit for message inserts.
+
+    With ``message_group_commit`` on, inserts are queued and a single writer
+    task commits them in batches (up to ``message_group_commit_max_rows``
+    rows, or whatever arrived within ``message_group_commit_window_ms``), so
+    a burst of chat lines costs one transaction (and one fsync on SQLite)
+    instead of one each. Callers are resumed in queue order once their
+    batch has committed, which keeps per-room ordering for the broadcasts
+    they send next. With it off, ``insert`` commits inline.
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.message_group_commit:
+            self._task = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Commit whatever is still queued before shutting down
+        self.queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def insert(self, db: AsyncSession, message: Message) -> Message:
+        """Persist a new message; returns once it is committed and has an id."""
+        if self._task is None:
+            db.add(message)
+            await db.commit()
+            return message
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((message, future))
+        return await future
+
+    async def _next_batch(self) -> Tuple[List[PendingInsert], bool]:
+        first = await self.queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.message_group_commit_window_ms / 1000
+        while len(batch) < settings.message_group_commit_max_rows:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _write_loop(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._write_batch(batch)
+            if stopping:
+                return
+
+    async def _write_batch(self, batch: List[PendingInsert]):
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all([message for message, _ in batch])
+                await db.commit()
+        except Exception as e:
+            # Retry row by row so one bad insert only fails its own request
+            print(f"Group commit of {len(batch)} messages failed, retrying individually: {e}")
+            for message, future in batch:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        db.add(message)
+                        await db.commit()
+                except Exception as row_error:
+                    if not future.done():
+                        future.set_exception(row_error)
+                    continue
+                if not future.done():
+                    future.set_result(message)
+            return
+
+        for message, future in batch:
+            if not future.done():  # the request may have been cancelled meanwhile
+                future.set_result(message)
+
+message_writer = MessageWriter()
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+from sqlalchemy import bindparam, update
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models.user import User
+from .websocket_manager import ConnectionManager, manager
+from .etags import change_versions, PRESENCE_KEY
+
+settings = get_settings()
+
+class PresenceRegistry:
+    """In-memory online/last_seen state for users connected to this worker.
+
+    Connects and disconnects only touch memory. A flush task writes the
+    changes to users.is_online / users.last_seen in one batched UPDATE per
+    tick and broadcasts a presence diff to the rooms each changed user is in,
+    so a reconnect storm costs one write per tick instead of one per socket.
+
+    State is per worker. With ``ws_backplane = "unix"`` a user whose tabs are
+    spread over several workers is written offline when their last tab on
+    any one worker closes, and shows online again on their next connect.
+    """
+
+    def __init__(self, connection_manager: ConnectionManager):
+        self.manager = connection_manager
+        # The manager reports a user's last disconnect however it happened
+        # (client close, send error, slow consumer drop)
+        connection_manager.on_user_offline = self.mark_offline
+        self.online: Dict[int, bool] = {}
+        self.last_seen: Dict[int, datetime] = {}
+        self.pending: Set[int] = set()
+        # Rooms to notify for a pending change (an offline user has already left them)
+        self.pending_rooms: Dict[int, Set[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self.flush()
+
+    def mark_online(self, user_id: int):
+        self._record(user_id, True, ())
+
+    def mark_offline(self, user_id: int, rooms: Iterable[int] = ()):
+        self._record(user_id, False, rooms)
+
+    def is_online(self, user_id: int, default: bool = False) -> bool:
+        """Presence as this worker knows it, falling back to the persisted value."""
+        return self.online.get(user_id, default)
+
+    def _record(self, user_id: int, is_online: bool, rooms: Iterable[int]):
+        self.online[user_id] = is_online
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        self.pending.add(user_id)
+        self.pending_rooms.setdefault(user_id, set()).update(rooms)
+        change_versions.bump(PRESENCE_KEY)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        user_ids, self.pending = self.pending, set()
+        rooms_by_user, self.pending_rooms = self.pending_rooms, {}
+
+        params = [
+            {"b_user_id": uid, "b_is_online": self.online[uid], "b_last_seen": self.last_seen[uid]}
+            for uid in user_ids
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.id == bindparam("b_user_id"))
+                    .values(is_online=bindparam("b_is_online"), last_seen=bindparam("b_last_seen")),
+                    params
+                )
+                await db.commit()
+        except Exception:
+            # Retry on the next tick
+            self.pending |= user_ids
+            for uid, rooms in rooms_by_user.items():
+                self.pending_rooms.setdefault(uid, set()).update(rooms)
+            raise
+
+        change_versions.bump(PRESENCE_KEY)  # last_seen now comes from the DB row
+        # Offline users are forgotten once persisted; the DB value is now accurate
+        for uid in user_ids:
+            if uid not in self.pending and not self.online[uid]:
+                del self.online[uid]
+                del self.last_seen[uid]
+
+        await self._broadcast_diffs(params, rooms_by_user)
+
+    async def _broadcast_diffs(self, params: List[dict], rooms_by_user: Dict[int, Set[int]]):
+        changes_by_room: Dict[int, List[dict]] = {}
+        for row in params:
+            uid = row["b_user_id"]
+            rooms = set(rooms_by_user.get(uid, ()))
+            for connection in self.manager.active_connections.get(uid, ()):
+                rooms.update(connection.rooms)
+            change = {"user_id": uid, "is_online": row["b_is_online"], "last_seen": row["b_last_seen"]}
+            for room_id in rooms:
+                changes_by_room.setdefault(room_id, []).append(change)
+
+        for room_id, changes in changes_by_room.items():
+            await self.manager.broadcast_to_room(room_id, {
+                "type": "presence",
+                "room_id": room_id,
+                "users": changes
+            })
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.presence_flush_interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing presence: {e}")
+
+presence = PresenceRegistry(manager)
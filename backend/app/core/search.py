@@ -0,0 +1,120 @@
+"""Full-text message search on SQLite FTS5.
+
+``messages_fts`` is an external-content FTS5 table over ``messages.content``
+and ``messages.file_name``: it stores only the inverted index and reads the
+text back from ``messages`` for snippets. Triggers on ``messages`` keep it in
+sync, so every write path (REST, /ws frames, group commit) is covered.
+"""
+from typing import List, Optional, Tuple
+import html
+import re
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, file_name,
+        content='messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, file_name)
+        VALUES (new.id, new.content, new.file_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, file_name)
+        VALUES ('delete', old.id, old.content, old.file_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, file_name ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, file_name)
+        VALUES ('delete', old.id, old.content, old.file_name);
+        INSERT INTO messages_fts(rowid, content, file_name)
+        VALUES (new.id, new.content, new.file_name);
+    END""",
+]
+
+# Column weights for bm25(): a hit in the text counts more than one in a file name
+SCORE_EXPRESSION = "bm25(messages_fts, 1.0, 0.5)"
+# Hits are delimited with control characters, then the text is HTML-escaped and
+# the delimiters become <mark> tags, so message text can never inject markup
+HIGHLIGHT_START, HIGHLIGHT_END = "\x02", "\x03"
+SNIPPET_EXPRESSION = "snippet(messages_fts, -1, char(2), char(3), '…', 12)"
+
+# A word, optionally ending in * for a prefix match ("deploy*")
+TOKEN_PATTERN = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+def search_supported(bind: Engine) -> bool:
+    return bind.dialect.name == "sqlite"
+
+def ensure_search_index(bind: Engine):
+    """Create the FTS table and triggers if missing, indexing existing rows once."""
+    if not search_supported(bind):
+        return
+    with bind.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first() is not None
+        create_search_index(conn, rebuild=not exists)
+
+def create_search_index(conn: Connection, rebuild: bool = True):
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(text(statement))
+    if rebuild:
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query where every word must match.
+
+    Words are quoted so FTS5 operators in user input are taken literally.
+    Prefix matching is opt-in with a trailing ``*``: a short prefix can
+    expand to a large share of the index, and ranking all of those hits is
+    what makes a search slow.
+    """
+    terms = [f'"{word}"{star}' for word, star in TOKEN_PATTERN.findall(query)]
+    if not terms:
+        return None
+    return " ".join(terms)
+
+def highlight_snippet(snippet: str) -> str:
+    """Escape a raw snippet for HTML, keeping only the <mark> tags around hits."""
+    return (
+        html.escape(snippet)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
+
+def search_messages(
+    db: Session,
+    match: str,
+    room_id: Optional[int] = None,
+    member_id: Optional[int] = None,
+    after: Optional[Tuple[float, int]] = None,
+    limit: int = 20
+) -> List[dict]:
+    """Best matches first, as rows of (id, score, snippet); lower score is better.
+
+    Scope with ``room_id`` or to the rooms ``member_id`` belongs to.
+    ``after`` is the (score, id) of the last row of the previous page.
+    """
+    filters = ["messages_fts MATCH :match"]
+    params = {"match": match, "limit": limit}
+    if room_id is not None:
+        filters.append("m.room_id = :room_id")
+        params["room_id"] = room_id
+    if member_id is not None:
+        filters.append(
+            "m.room_id IN (SELECT room_id FROM room_members WHERE user_id = :member_id)"
+        )
+        params["member_id"] = member_id
+    if after is not None:
+        filters.append(f"({SCORE_EXPRESSION} > :after_score OR ({SCORE_EXPRESSION} = :after_score AND m.id > :after_id))")
+        params.update(after_score=after[0], after_id=after[1])
+
+    rows = db.execute(text(
+        f"SELECT m.id AS id, {SCORE_EXPRESSION} AS score, {SNIPPET_EXPRESSION} AS snippet "
+        "FROM messages_fts JOIN messages AS m ON m.id = messages_fts.rowid "
+        f"WHERE {' AND '.join(filters)} "
+        "ORDER BY score, m.id LIMIT :limit"
+    ), params).mappings().all()
+    return [dict(row, snippet=highlight_snippet(row["snippet"])) for row in rows]
@@ -1,17 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ..config import get_settings
-from ..database import get_db
+from ..database import get_db, AsyncSessionLocal
 from ..models.user import User
+from ..schemas.auth import AuthenticatedUser
+from .auth_cache import AuthCache
 
 settings = get_settings()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pinning min/max to the configured cost makes verify_and_update rehash on cost changes
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds
+)
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop;
+# requests beyond the cap queue in the executor
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+auth_cache = AuthCache(settings.auth_cache_size, settings.auth_cache_ttl_seconds)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -19,6 +38,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify off the event loop; also returns a new hash if the stored one uses an outdated cost"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -29,7 +59,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-async def get_current_user(
+def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
@@ -50,3 +80,40 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
     return user
+
+async def authenticate_token(token: str) -> Optional[AuthenticatedUser]:
+    """Resolve a bearer token to the caller's identity, hitting the DB only on a cache miss"""
+    identity = auth_cache.get(token)
+    if identity is not None:
+        return identity
+
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    if user is None:
+        return None
+
+    identity = AuthenticatedUser.model_validate(user)
+    auth_cache.set(token, identity, payload.get("exp"))
+    return identity
+
+async def get_authenticated_user(token: str = Depends(oauth2_scheme)) -> AuthenticatedUser:
+    # For handlers that only need who the caller is, not a live User row
+    identity = await authenticate_token(token)
+    if identity is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return identity
+
+def invalidate_user_cache(user_id: int):
+    auth_cache.invalidate_user(user_id)
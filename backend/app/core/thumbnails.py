@@ -0,0 +1,128 @@
+"""Thumbnails and WebP previews for image attachments and avatars.
+
+Decoding and resizing are CPU-bound, so they run in a small process pool,
+scheduled as a background task once the upload response has been sent.
+Variants are written next to the original as ``<stem>.thumb.webp`` and
+``<stem>.preview.webp``. Content-addressed attachments share one set, and a
+variant that already exists is reused instead of rendered again.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Tuple
+import asyncio
+import os
+from PIL import Image, ImageOps
+from ..config import get_settings
+
+settings = get_settings()
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+THUMBNAIL = "thumb"
+PREVIEW = "preview"
+VARIANT_KINDS = (THUMBNAIL, PREVIEW)
+WEBP_QUALITY = 80
+ORIENTATION_TAG = 0x0112
+
+# (kind, bounding box in px, crop to a square)
+Variant = Tuple[str, int, bool]
+
+def create_thumbnail_executor() -> ProcessPoolExecutor:
+    # Workers are spawned (not forked) on first use, so they don't inherit the event loop or sockets
+    return ProcessPoolExecutor(
+        max_workers=settings.thumbnail_workers,
+        mp_context=get_context("spawn")
+    )
+
+thumbnail_executor = create_thumbnail_executor()
+
+def is_image(path: Path) -> bool:
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+def variant_path(original: Path, kind: str) -> Path:
+    return original.with_name(f"{original.stem}.{kind}.webp")
+
+def variant_url(original_url: str, kind: str) -> str:
+    stem, _, _ = original_url.rpartition(".")
+    return f"{stem}.{kind}.webp"
+
+def attachment_variants() -> List[Variant]:
+    return [
+        (THUMBNAIL, settings.thumbnail_size, False),
+        (PREVIEW, settings.preview_size, False),
+    ]
+
+def avatar_variants() -> List[Variant]:
+    return [
+        (THUMBNAIL, settings.avatar_thumbnail_size, True),
+        (PREVIEW, settings.avatar_preview_size, True),
+    ]
+
+def render_variants(source: str, variants: List[Variant], reuse: bool) -> dict:
+    """Runs in a worker process. Returns the original's size and each variant's (width, height).
+
+    Animated images get no variants.
+    """
+    sizes = {}
+    with Image.open(source) as opened:
+        if opened.width * opened.height > settings.thumbnail_max_pixels:
+            raise ValueError(f"{opened.width}x{opened.height} image is too large to thumbnail")
+        width, height = opened.size
+        # EXIF orientations 5-8 are rotated a quarter turn
+        if opened.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        if getattr(opened, "is_animated", False):
+            # A still variant would freeze an animated GIF/WebP; clients keep the original
+            return {"width": width, "height": height, "variants": sizes}
+        image = None
+        for kind, box, square in variants:
+            destination = variant_path(Path(source), kind)
+            if reuse and destination.exists():
+                with Image.open(destination) as existing:
+                    sizes[kind] = existing.size
+                continue
+            if image is None:
+                # Only decode the original once something actually has to be rendered
+                image = ImageOps.exif_transpose(opened)
+                if image.mode not in ("RGB", "RGBA"):
+                    has_alpha = "A" in image.getbands() or "transparency" in image.info
+                    image = image.convert("RGBA" if has_alpha else "RGB")
+            if square:
+                variant = ImageOps.fit(image, (box, box))
+            else:
+                variant = image.copy()
+                variant.thumbnail((box, box))  # never upscales
+            # Written beside the target and renamed, so a half-written file is never served
+            temp = destination.with_name(f".{destination.name}.{os.getpid()}")
+            variant.save(temp, "WEBP", quality=WEBP_QUALITY)
+            os.replace(temp, destination)
+            sizes[kind] = variant.size
+    return {"width": width, "height": height, "variants": sizes}
+
+async def generate_variants(source: Path, variants: List[Variant], reuse: bool = False) -> dict:
+    global thumbnail_executor
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = thumbnail_executor
+        try:
+            return await loop.run_in_executor(executor, render_variants, str(source), variants, reuse)
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill) and the pool refuses all further work:
+            # replace it, and retry once in case another job was the one that killed it
+            if thumbnail_executor is executor:
+                print("Thumbnail worker pool broke; starting a new one")
+                thumbnail_executor = create_thumbnail_executor()
+                executor.shutdown(wait=False, cancel_futures=True)
+            if attempt:
+                raise
+
+def remove_variants(original: Path):
+    for kind in VARIANT_KINDS:
+        try:
+            os.unlink(variant_path(original, kind))
+        except FileNotFoundError:
+            pass
+
+def shutdown_thumbnail_executor():
+    thumbnail_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,130 @@
+"""Constant-memory upload handling shared by message attachments and avatars.
+
+The multipart parser has already spooled the file (to disk past 1MB). The
+copy into the uploads directory runs in the threadpool in fixed-size chunks,
+enforcing ``max_file_size`` and hashing in the same pass. It writes to a
+temp file next to the destination and is renamed into place, so a
+half-written file is never served. ``UploadLimitMiddleware`` rejects
+oversized requests before their body is read at all.
+"""
+from pathlib import Path
+from typing import Iterable, Optional
+import hashlib
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..utils.serialization import dumps
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for multipart boundaries, headers and the other form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (max {max_size // (1024 * 1024)}MB)")
+
+class ReceivedUpload:
+    """An upload copied to a temp file in its final directory, with its size and SHA-256."""
+
+    def __init__(self, temp_path: Path, size: int, sha256: str):
+        self.temp_path = temp_path
+        self.size = size
+        self.sha256 = sha256
+
+    def move_to(self, destination: Path):
+        # Same directory, so this is an atomic rename
+        os.replace(self.temp_path, destination)
+
+    def discard(self):
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+def copy_upload(source, directory: Path, max_size: int) -> ReceivedUpload:
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large(max_size)
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+    return ReceivedUpload(Path(temp_name), size, digest.hexdigest())
+
+async def receive_upload(file: UploadFile, directory: Path, max_size: int) -> ReceivedUpload:
+    """Stream ``file`` into ``directory`` off the event loop."""
+    await file.seek(0)
+    return await run_in_threadpool(copy_upload, file.file, directory, max_size)
+
+class UploadLimitMiddleware:
+    """Answer 413 for upload requests whose body would exceed the limit.
+
+    A Content-Length over the limit is refused before anything is read.
+    Bodies without one (chunked) are counted as they arrive and the form
+    parser is stopped with a 413 once they pass the limit.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], max_file_size: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_file_size = max_file_size
+        self.max_body_size = max_file_size + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self.content_length(scope)
+        if content_length is not None and content_length > self.max_body_size:
+            await self.reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # FastAPI re-raises HTTPExceptions from body parsing as-is
+                    raise too_large(self.max_file_size)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def content_length(scope: Scope) -> Optional[int]:
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def reject(self, send: Send):
+        body = dumps({"detail": too_large(self.max_file_size).detail})
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
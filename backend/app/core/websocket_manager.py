@@ -1,78 +1,212 @@
-from typing import Dict, Set, Optional
+from typing import Callable, Dict, Iterable, List, Set, Optional, Any, Hashable
 from fastapi import WebSocket
-import json
+import asyncio
+import time
+from ..config import get_settings
+from ..utils.serialization import dumps_text
+from .backplane import Backplane, create_backplane
+
+settings = get_settings()
+
+# Close code sent to a client whose outbound queue overflowed ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+class ClientConnection:
+    """One live socket (a tab or device) with its own bounded outbound queue.
+
+    Broadcasts only enqueue an already-encoded text frame and a writer task
+    drains the queue, so one stalled client never delays delivery to anyone
+    else. If the queue fills up the connection is dropped (see
+    ConnectionManager.drop_slow_consumer); the client reconnects and
+    refetches history.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, max_queue: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.rooms: Set[int] = set()  # rooms this particular connection subscribed to
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.writer_task: Optional[asyncio.Task] = None
+
+    def start(self, manager: "ConnectionManager"):
+        self.writer_task = asyncio.create_task(self._write_loop(manager))
+
+    def enqueue(self, frame: str) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write_loop(self, manager: "ConnectionManager"):
+        try:
+            while True:
+                frame = await self.queue.get()
+                await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to user {self.user_id}: {e}")
+            await manager.disconnect(self)
+
+    def stop(self):
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+
+    async def close(self, code: int):
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+def add_to_index(index: Dict[int, Set[Any]], key: int, value: Hashable):
+    index.setdefault(key, set()).add(value)
+
+def discard_from_index(index: Dict[int, Set[Any]], key: int, value: Hashable):
+    # Empty sets are dropped so idle rooms/users don't accumulate
+    members = index.get(key)
+    if members is None:
+        return
+    members.discard(value)
+    if not members:
+        del index[key]
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # Forwards room frames to other worker processes (no-op in a single process)
+        self.backplane = backplane or Backplane()
+        # Every live connection of a user; presence is "online" while this is non-empty
+        self.active_connections: Dict[int, Set[ClientConnection]] = {}
         self.user_usernames: Dict[int, str] = {}  # NEW: Map user_id to username
-        self.room_members: Dict[int, Set[int]] = {}
-        self.typing_users: Dict[int, Set[int]] = {}
+        # Room subscriptions are per connection, so each device only gets rooms it joined
+        self.room_members: Dict[int, Set[ClientConnection]] = {}
+        # room_id -> {user_id: monotonic time the typing flag expires}
+        self.typing_users: Dict[int, Dict[int, float]] = {}
+        # Reverse index so per-user work only touches that user's rooms
+        self.user_typing_rooms: Dict[int, Set[int]] = {}
+        # Typing changes are coalesced and flushed once per tick (see flush_typing)
+        self.dirty_typing_rooms: Set[int] = set()
+        self.sent_typing_names: Dict[int, List[str]] = {}
+        self._typing_task: Optional[asyncio.Task] = None
+        # Called with (user_id, rooms of the closing connection) when a user's last
+        # connection goes, whichever path removed it (set by PresenceRegistry)
+        self.on_user_offline: Optional[Callable[[int, Iterable[int]], None]] = None
+
+    async def start(self):
+        await self.backplane.start(self.deliver_frame)
+        self._typing_task = asyncio.create_task(self._typing_flush_loop())
+
+    async def stop(self):
+        if self._typing_task is not None:
+            self._typing_task.cancel()
+        await self.backplane.stop()
 
     # Updated to accept username
-    async def connect(self, websocket: WebSocket, user_id: int, username: str):
+    async def connect(self, websocket: WebSocket, user_id: int, username: str) -> ClientConnection:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        connection = ClientConnection(websocket, user_id, settings.ws_send_queue_size)
+        connection.start(self)
+        add_to_index(self.active_connections, user_id, connection)
         self.user_usernames[user_id] = username
-        print(f"User {user_id} ({username}) connected. Total connections: {len(self.active_connections)}")
-
-    async def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.user_usernames:
-            del self.user_usernames[user_id]
-        
-        # Remove from all rooms
-        for room_id in list(self.room_members.keys()):
-            if user_id in self.room_members[room_id]:
-                self.room_members[room_id].remove(user_id)
-                
-        # Remove from typing sets
-        for room_id in list(self.typing_users.keys()):
-            if user_id in self.typing_users[room_id]:
-                self.typing_users[room_id].remove(user_id)
-                # Broadcast the update that they stopped typing
-                await self.broadcast_typing_list(room_id, exclude_user=user_id)
-    
-        print(f"User {user_id} disconnected. Total connections: {len(self.active_connections)}")
-
-    async def join_room(self, user_id: int, room_id: int):
+        print(f"User {user_id} ({username}) connected. Devices: {len(self.active_connections[user_id])}")
+        return connection
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.active_connections
+
+    async def disconnect(self, connection: ClientConnection) -> bool:
+        """Remove one connection. Returns True if it was the user's last one."""
+        user_id = connection.user_id
+        connection.stop()
+        if connection not in self.active_connections.get(user_id, ()):
+            return False
+        discard_from_index(self.active_connections, user_id, connection)
+
+        # Remove this connection's room subscriptions
+        rooms, connection.rooms = connection.rooms, set()
+        for room_id in rooms:
+            self._remove_room_member(room_id, connection)
+
+        if self.is_online(user_id):
+            print(f"User {user_id} closed a connection. Devices: {len(self.active_connections[user_id])}")
+            return False
+
+        # Last device gone: clear user-level state
+        self.user_usernames.pop(user_id, None)
+        for room_id in self.user_typing_rooms.pop(user_id, set()):
+            # The next flush broadcasts that they stopped typing
+            self._clear_typing(room_id, user_id)
+        if self.on_user_offline is not None:
+            self.on_user_offline(user_id, rooms)
+
+        print(f"User {user_id} disconnected. Online users: {len(self.active_connections)}")
+        return True
+
+    async def join_room(self, connection: ClientConnection, room_id: int):
         if room_id not in self.room_members:
-            self.room_members[room_id] = set()
-        self.room_members[room_id].add(user_id)
-        print(f"User {user_id} joined room {room_id}")
+            # First local member: ask the backplane to route this room's frames here
+            self.backplane.subscribe(room_id)
+        add_to_index(self.room_members, room_id, connection)
+        connection.rooms.add(room_id)
+        print(f"User {connection.user_id} joined room {room_id}")
 
-    async def leave_room(self, user_id: int, room_id: int):
-        if room_id in self.room_members and user_id in self.room_members[room_id]:
-            self.room_members[room_id].remove(user_id)
-        print(f"User {user_id} left room {room_id}")
+    async def leave_room(self, connection: ClientConnection, room_id: int):
+        self._remove_room_member(room_id, connection)
+        connection.rooms.discard(room_id)
+        print(f"User {connection.user_id} left room {room_id}")
+
+    def _remove_room_member(self, room_id: int, connection: ClientConnection):
+        if room_id not in self.room_members:
+            return
+        discard_from_index(self.room_members, room_id, connection)
+        if room_id not in self.room_members:
+            self.backplane.unsubscribe(room_id)
+
+    async def drop_slow_consumer(self, connection: ClientConnection):
+        print(f"Dropping slow consumer {connection.user_id}: outbound queue full")
+        await self.disconnect(connection)
+        # Closing can wait on the stalled peer, so never block the broadcaster on it
+        asyncio.create_task(connection.close(SLOW_CONSUMER_CLOSE_CODE))
 
     async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except Exception as e:
-                print(f"Error sending to user {user_id}: {e}")
-                await self.disconnect(user_id)
+        frame = dumps_text(message)
+        slow_connections = [
+            connection for connection in self.active_connections.get(user_id, ())
+            if not connection.enqueue(frame)
+        ]
+        for connection in slow_connections:
+            await self.drop_slow_consumer(connection)
+
+    async def send_to_connection(self, connection: ClientConnection, message: dict):
+        # Replies (acks, errors) go to the socket that asked, not every device of the user
+        if not connection.enqueue(dumps_text(message)):
+            await self.drop_slow_consumer(connection)
 
     async def broadcast_to_room(self, room_id: int, message: dict, exclude_user: int = None):
+        if room_id not in self.room_members and not self.backplane.distributed:
+            return
+        # Encode once per event; every recipient gets the same frame
+        await self.broadcast_frame(room_id, dumps_text(message), exclude_user=exclude_user)
+
+    async def broadcast_frame(self, room_id: int, frame: str, exclude_user: int = None):
+        # Other workers deliver to their own members; this one delivers locally
+        self.backplane.publish(room_id, frame, exclude_user)
+        await self.deliver_frame(room_id, frame, exclude_user)
+
+    async def deliver_frame(self, room_id: int, frame: str, exclude_user: Optional[int] = None):
         if room_id not in self.room_members:
             return
-        
-        disconnected_users = []
-        for user_id in self.room_members[room_id]:
-            if exclude_user and user_id == exclude_user:
+
+        slow_connections = []
+        for connection in self.room_members[room_id]:
+            if exclude_user and connection.user_id == exclude_user:
                 continue
-            
-            if user_id in self.active_connections:
-                try:
-                    await self.active_connections[user_id].send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting to user {user_id}: {e}")
-                    disconnected_users.append(user_id)
-        
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
+            if not connection.enqueue(frame):
+                slow_connections.append(connection)
+
+        for connection in slow_connections:
+            await self.drop_slow_consumer(connection)
 
     async def broadcast_new_message(self, room_id: int, message_data: dict):
         await self.broadcast_to_room(room_id, {
@@ -81,42 +215,61 @@ class ConnectionManager:
             "message": message_data
         })
 
-    async def broadcast_typing(self, room_id: int, user_id: int, username: str, is_typing: bool):
-        if room_id not in self.typing_users:
-            self.typing_users[room_id] = set()
-        
+    def set_typing(self, room_id: int, user_id: int, is_typing: bool):
+        """Record a typing flag; the room's list goes out on the next flush tick."""
         if is_typing:
-            self.typing_users[room_id].add(user_id)
+            expires_at = time.monotonic() + settings.typing_timeout_seconds
+            self.typing_users.setdefault(room_id, {})[user_id] = expires_at
+            add_to_index(self.user_typing_rooms, user_id, room_id)
+            self.dirty_typing_rooms.add(room_id)
         else:
-            self.typing_users[room_id].discard(user_id)
-        
-        await self.broadcast_typing_list(room_id, exclude_user=user_id)
-
-    async def broadcast_typing_list(self, room_id: int, exclude_user: int):
-        # Resolve user_ids to usernames
-        typing_usernames = []
-        if room_id in self.typing_users:
-            for uid in self.typing_users[room_id]:
-                # We can't include the person receiving the message in the list "Alice is typing" if I am Alice
-                if uid != exclude_user: 
-                    name = self.user_usernames.get(uid, "Unknown")
-                    typing_usernames.append(name)
-        
-        # Broadcast to everyone (except the person typing, usually)
-        # But actually, everyone needs to know the FULL list of OTHER people typing.
-        # Simplification: Broadcast the list of *all* typing users, let frontend filter "me" out.
-        
-        # Re-calculating full list for broadcast
-        all_typing_names = []
-        if room_id in self.typing_users:
-             for uid in self.typing_users[room_id]:
-                 name = self.user_usernames.get(uid, "Unknown")
-                 all_typing_names.append(name)
+            self._clear_typing(room_id, user_id)
+            discard_from_index(self.user_typing_rooms, user_id, room_id)
 
-        await self.broadcast_to_room(room_id, {
-            "type": "typing",
-            "room_id": room_id,
-            "users": all_typing_names 
-        }, exclude_user=exclude_user)
+    def _clear_typing(self, room_id: int, user_id: int):
+        typists = self.typing_users.get(room_id)
+        if typists is None or typists.pop(user_id, None) is None:
+            return
+        if not typists:
+            del self.typing_users[room_id]
+        self.dirty_typing_rooms.add(room_id)
+
+    async def flush_typing(self):
+        # Expire flags whose client never sent is_typing=False (closed tab, lost frame)
+        now = time.monotonic()
+        for room_id, typists in list(self.typing_users.items()):
+            for user_id, expires_at in list(typists.items()):
+                if expires_at <= now:
+                    self._clear_typing(room_id, user_id)
+                    discard_from_index(self.user_typing_rooms, user_id, room_id)
+
+        dirty_rooms, self.dirty_typing_rooms = self.dirty_typing_rooms, set()
+        for room_id in dirty_rooms:
+            names = sorted(
+                self.user_usernames.get(uid, "Unknown")
+                for uid in self.typing_users.get(room_id, ())
+            )
+            # Only broadcast when the visible list actually changed
+            if names == self.sent_typing_names.get(room_id, []):
+                continue
+            if names:
+                self.sent_typing_names[room_id] = names
+            else:
+                self.sent_typing_names.pop(room_id, None)
+            # Broadcast the list of *all* typing users, let frontend filter "me" out.
+            await self.broadcast_to_room(room_id, {
+                "type": "typing",
+                "room_id": room_id,
+                "users": names
+            })
+
+    async def _typing_flush_loop(self):
+        interval = settings.typing_flush_interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_typing()
+            except Exception as e:
+                print(f"Error flushing typing indicators: {e}")
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(create_backplane(settings))
@@ -5,11 +5,19 @@ from pathlib import Path
 from .database import engine, Base
 from .routers import auth, users, messages, rooms, websocket
 from .config import get_settings
+from .core.websocket_manager import manager
+from .core.presence import presence
+from .core.message_writer import message_writer
+from .core.search import ensure_search_index
+from .core.uploads import UploadLimitMiddleware
+from .core.attachments import ImmutableStaticFiles, OBJECTS_DIR
+from .core.thumbnails import shutdown_thumbnail_executor
 
 settings = get_settings()
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+ensure_search_index(engine)
 
 # Create uploads directory
 Path(settings.upload_dir).mkdir(exist_ok=True)
@@ -20,6 +28,13 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized uploads before reading the body (added first so CORS still wraps the 413)
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths={"/api/messages/upload", "/api/users/upload-avatar"},
+    max_file_size=settings.max_file_size
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,9 +42,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
-# Serve uploaded files
+# Serve uploaded files (content-addressed attachments first, so they get immutable caching)
+objects_dir = Path(settings.upload_dir) / OBJECTS_DIR
+objects_dir.mkdir(exist_ok=True)
+app.mount("/uploads/objects", ImmutableStaticFiles(directory=objects_dir), name="attachments")
 app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
 
 # Include routers
@@ -39,6 +58,19 @@ app.include_router(messages.router, prefix="/api/messages", tags=["Messages"])
 app.include_router(rooms.router, prefix="/api/rooms", tags=["Rooms"])
 app.include_router(websocket.router, tags=["WebSocket"])
 
+@app.on_event("startup")
+async def start_websocket_manager():
+    await manager.start()
+    await presence.start()
+    await message_writer.start()
+
+@app.on_event("shutdown")
+async def stop_websocket_manager():
+    await message_writer.stop()
+    await presence.stop()
+    await manager.stop()
+    shutdown_thumbnail_executor()
+
 @app.get("/")
 async def root():
     return {
@@ -1,5 +1,6 @@
 from .user import User
 from .message import Message, Reaction
 from .room import Room, room_members
+from .attachment import Attachment
 
-__all__ = ['User', 'Message', 'Reaction', 'Room', 'room_members']
+__all__ = ['User', 'Message', 'Reaction', 'Room', 'room_members', 'Attachment']
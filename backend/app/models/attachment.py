@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime, timezone
+from ..database import Base
+
+def get_utc_now():
+    return datetime.now(timezone.utc)
+
+class Attachment(Base):
+    """One stored file, shared by every message that uploaded the same bytes."""
+    __tablename__ = "attachments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Relative to settings.upload_dir, e.g. "objects/ab/ab12...ef.png"
+    storage_path = Column(String, nullable=False)
+    # Messages pointing at this file; the file is deleted when it drops to 0
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=get_utc_now)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone # Import timezone
 from ..database import Base
@@ -16,6 +16,15 @@ class Message(Base):
     message_type = Column(String, default="text")
     file_url = Column(String, nullable=True)
     file_name = Column(String, nullable=True)
+    # Set for uploads stored in the content-addressed attachment store
+    attachment_id = Column(Integer, ForeignKey("attachments.id"), nullable=True, index=True)
+    # Filled in by the background thumbnail job for image uploads
+    thumbnail_url = Column(String, nullable=True)
+    thumbnail_width = Column(Integer, nullable=True)
+    thumbnail_height = Column(Integer, nullable=True)
+    preview_url = Column(String, nullable=True)
+    image_width = Column(Integer, nullable=True)
+    image_height = Column(Integer, nullable=True)
     # Changed default to timezone-aware function
     timestamp = Column(DateTime(timezone=True), default=get_utc_now, index=True)
     
@@ -23,6 +32,11 @@ class Message(Base):
     room = relationship("Room", back_populates="messages")
     reactions = relationship("Reaction", back_populates="message", cascade="all, delete-orphan")
 
+    # Keyset pagination walks room history in (timestamp, id) order
+    __table_args__ = (
+        Index("ix_messages_room_timestamp_id", "room_id", "timestamp", "id"),
+    )
+
 class Reaction(Base):
     __tablename__ = "reactions"
 
@@ -34,4 +48,9 @@ class Reaction(Base):
     created_at = Column(DateTime(timezone=True), default=get_utc_now)
     
     user = relationship("User")
-    message = relationship("Message", back_populates="reactions")
\ No newline at end of file
+    message = relationship("Message", back_populates="reactions")
+
+    # Serves both the per-message reaction fetch (prefix) and the toggle lookup
+    __table_args__ = (
+        Index("ix_reactions_message_user_emoji", "message_id", "user_id", "emoji"),
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from ..database import Base
@@ -10,7 +10,9 @@ room_members = Table(
     'room_members',
     Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id')),
-    Column('room_id', Integer, ForeignKey('rooms.id'))
+    Column('room_id', Integer, ForeignKey('rooms.id')),
+    # Membership checks and member counts look up (room_id, user_id); a user joins a room once
+    Index('ux_room_members_room_user', 'room_id', 'user_id', unique=True)
 )
 
 # Room invites table
@@ -23,7 +25,9 @@ room_invites = Table(
     Column('invited_by', Integer, ForeignKey('users.id')),
     Column('status', String, default='pending'),
     # FIX: Use timezone-aware datetime
-    Column('created_at', DateTime(timezone=True), default=get_utc_now)
+    Column('created_at', DateTime(timezone=True), default=get_utc_now),
+    # Pending-invite lookups for the current user
+    Index('ix_room_invites_user_status', 'user_id', 'status')
 )
 
 class Room(Base):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -13,6 +13,9 @@ class User(Base):
     full_name = Column(String(100))
     bio = Column(Text)
     avatar_url = Column(String(255), default="default-avatar.png")
+    # Square WebP variants of an uploaded avatar, set once the background job has rendered them
+    avatar_thumbnail_url = Column(String(255), nullable=True)
+    avatar_preview_url = Column(String(255), nullable=True)
     avatar_color = Column(String(7), default="#6366f1")
     is_online = Column(Boolean, default=False)
     last_seen = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -25,4 +28,11 @@ class User(Base):
     
     # FIX 2: Added missing 'rooms' relationship (required by Room.members)
     # We use the string "room_members" to refer to the association table defined in room.py
-    rooms = relationship("Room", secondary="room_members", back_populates="members")
\ No newline at end of file
+    rooms = relationship("Room", secondary="room_members", back_populates="members")
+
+    # Case-insensitive prefix lookups for the user picker (see routers/users.py);
+    # the username one also orders the paginated listing
+    __table_args__ = (
+        Index("ix_users_username_lower", func.lower(username)),
+        Index("ix_users_full_name_lower", func.lower(full_name)),
+    )
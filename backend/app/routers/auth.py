@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
 from ..schemas.user import UserCreate, UserLogin, UserResponse
 from ..schemas.auth import Token
-from ..core.security import verify_password, get_password_hash, create_access_token
+from ..core.security import hash_password, verify_and_update_password, create_access_token
+from ..core.etags import change_versions, PROFILES_KEY
 from ..config import get_settings
 import random
 
@@ -17,13 +19,13 @@ def generate_avatar_color():
     return random.choice(colors)
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    if (await db.execute(select(User.id).where(User.username == user_data.username))).first():
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Check if email exists
-    if db.query(User).filter(User.email == user_data.email).first():
+    if (await db.execute(select(User.id).where(User.email == user_data.email))).first():
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
@@ -31,12 +33,12 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         username=user_data.username,
         email=user_data.email,
         full_name=user_data.full_name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await hash_password(user_data.password),
         avatar_color=generate_avatar_color()
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    change_versions.bump(PROFILES_KEY)
     
     # Create access token
     access_token = create_access_token(data={"sub": user_data.username})
@@ -54,18 +56,23 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_data.username).first()
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.username == user_data.username))).scalars().first()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await verify_and_update_password(user_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
-    # Update online status
-    user.is_online = True
-    db.commit()
+    # Upgrade the stored hash if the configured bcrypt cost changed
+    # (online status is tracked by the presence registry once the WebSocket connects)
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     
     # Create access token
     access_token = create_access_token(data={"sub": user.username})
@@ -1,65 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, UploadFile, Form
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from ..database import get_db
+from ..database import AsyncSessionLocal, get_async_db
 from ..models.message import Message, Reaction
 from ..models.user import User
 from ..schemas.message import MessageCreate, MessageResponse, ReactionCreate, ReactionResponse
-from ..core.security import get_current_user
+from ..schemas.auth import AuthenticatedUser
+from ..core.security import get_authenticated_user
 from ..core.websocket_manager import manager
+from ..core.message_writer import message_writer
+from ..core.history_cache import history_cache
+from ..core.etags import change_versions, room_key
+from ..core.uploads import receive_upload
+from ..core.attachments import (
+    OBJECTS_DIR, attachment_url, collect_garbage, release_attachment, store_attachment, store_lock
+)
+from ..core.thumbnails import (
+    PREVIEW, THUMBNAIL, attachment_variants, generate_variants, is_image, variant_url
+)
+from ..utils.helpers import as_utc
+from ..config import get_settings
 from datetime import datetime
 import os
-import uuid
 from pathlib import Path
+from contextlib import nullcontext
 
 # Mounted at /api/messages in main.py
 router = APIRouter()
+settings = get_settings()
 
-@router.post("/", response_model=MessageResponse)
-async def create_message(
-    message: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
+# Shared by the REST endpoints below and the /ws send_message/react/delete frames
+
+async def post_message(db: AsyncSession, message: MessageCreate, current_user: AuthenticatedUser) -> dict:
     db_message = Message(
         content=message.content,
         user_id=current_user.id,
         room_id=message.room_id,
         message_type=message.message_type or "text"
     )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Before the commit, so a history read racing this insert can't cache a page that already has it
+    history_cache.invalidate(message.room_id)
+    # Committed inline, or with the next group-commit batch when enabled
+    await message_writer.insert(db, db_message)
     
     # FIX: Added all fields required by the strict Pydantic schema
+    # (same keys and order as the history rows in rooms.py, so cached pages encode identically)
     message_data = {
         "id": db_message.id,
         "content": db_message.content,
         "user_id": db_message.user_id,
         "room_id": db_message.room_id,
         "message_type": db_message.message_type,
-        "timestamp": db_message.timestamp,
+        "timestamp": as_utc(db_message.timestamp),
         "username": current_user.username,
         "avatar_color": current_user.avatar_color,
         "avatar_url": current_user.avatar_url,  # REQUIRED FIX
-        "file_url": None,
-        "file_name": None,
+        "avatar_thumbnail_url": current_user.avatar_thumbnail_url,
         "reply_to": None,                       # REQUIRED FIX
         "is_edited": False,                     # REQUIRED FIX
         "is_read": False,                       # REQUIRED FIX
+        "file_url": None,
+        "file_name": None,
+        "thumbnail_url": None,
+        "thumbnail_width": None,
+        "thumbnail_height": None,
+        "preview_url": None,
         "reactions": []
     }
     
+    history_cache.append(message.room_id, message_data)
+    change_versions.bump(room_key(message.room_id))
     await manager.broadcast_new_message(message.room_id, message_data)
     return message_data
 
-@router.delete("/{message_id}")
-async def delete_message(
-    message_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    message = db.query(Message).filter(Message.id == message_id).first()
+async def remove_message(db: AsyncSession, message_id: int, current_user: AuthenticatedUser):
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -67,46 +83,54 @@ async def delete_message(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     room_id = message.room_id
-    db.delete(message)
-    db.commit()
+    # The store lock keeps a concurrent upload of the same bytes from reusing a file being removed
+    async with store_lock if message.attachment_id else nullcontext():
+        orphaned_file = await release_attachment(db, message.attachment_id)
+        await db.delete(message)
+        await db.commit()
+        await collect_garbage(db, orphaned_file)
+    history_cache.remove(room_id, message_id)
+    change_versions.bump(room_key(room_id))
     
     await manager.broadcast_to_room(room_id, {
         "type": "message_deleted",
         "room_id": room_id,
         "message_id": message_id
     })
-    return {"message": "Message deleted"}
 
-@router.post("/{message_id}/reactions", response_model=ReactionResponse)
-async def add_reaction(
+async def toggle_reaction(
+    db: AsyncSession,
     message_id: int,
-    reaction: ReactionCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    message = db.query(Message).filter(Message.id == message_id).first()
+    emoji: str,
+    current_user: AuthenticatedUser
+) -> dict:
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    existing = db.query(Reaction).filter(
-        Reaction.message_id == message_id,
-        Reaction.user_id == current_user.id,
-        Reaction.emoji == reaction.emoji
-    ).first()
+    existing = (await db.execute(
+        select(Reaction).where(
+            Reaction.message_id == message_id,
+            Reaction.user_id == current_user.id,
+            Reaction.emoji == emoji
+        )
+    )).scalars().first()
     
     if existing:
-        db.delete(existing)
-        db.commit()
+        await db.delete(existing)
+        await db.commit()
+        history_cache.remove_reaction(message.room_id, message_id, current_user.id, emoji)
+        change_versions.bump(room_key(message.room_id))
         reaction_data = None
     else:
         db_reaction = Reaction(
             message_id=message_id,
             user_id=current_user.id,
-            emoji=reaction.emoji
+            emoji=emoji
         )
         db.add(db_reaction)
-        db.commit()
-        db.refresh(db_reaction)
+        history_cache.invalidate(message.room_id)
+        await db.commit()
         
         # FIX: Added username and created_at which are required by ReactionResponse
         reaction_data = {
@@ -115,8 +139,12 @@ async def add_reaction(
             "user_id": db_reaction.user_id,
             "message_id": db_reaction.message_id,
             "username": current_user.username,  # REQUIRED FIX
-            "created_at": db_reaction.created_at # REQUIRED FIX
+            "created_at": as_utc(db_reaction.created_at) # REQUIRED FIX
         }
+        history_cache.add_reaction(message.room_id, message_id, {
+            key: value for key, value in reaction_data.items() if key != "message_id"
+        })
+        change_versions.bump(room_key(message.room_id))
     
     if reaction_data:
         await manager.broadcast_to_room(message.room_id, {
@@ -131,43 +159,95 @@ async def add_reaction(
     # or handle it on frontend. Returning a dummy object to satisfy schema
     return {
         "id": 0,
-        "emoji": reaction.emoji,
+        "emoji": emoji,
         "user_id": current_user.id,
         "message_id": message_id,
         "username": current_user.username,
         "created_at": datetime.now()
     }
 
+@router.post("/", response_model=MessageResponse)
+async def create_message(
+    message: MessageCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    return await post_message(db, message, current_user)
+
+@router.delete("/{message_id}")
+async def delete_message(
+    message_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    await remove_message(db, message_id, current_user)
+    return {"message": "Message deleted"}
+
+@router.post("/{message_id}/reactions", response_model=ReactionResponse)
+async def add_reaction(
+    message_id: int,
+    reaction: ReactionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    return await toggle_reaction(db, message_id, reaction.emoji, current_user)
+
+async def render_message_images(message_id: int, room_id: int, source: Path, file_url: str):
+    try:
+        # Dedup'd uploads of the same image reuse the variants already rendered for it
+        rendered = await generate_variants(source, attachment_variants(), reuse=True)
+    except Exception as e:
+        print(f"Thumbnail generation failed for message {message_id}: {e}")
+        return
+    if THUMBNAIL not in rendered["variants"]:
+        return  # animated; the message keeps showing the original
+    thumbnail_width, thumbnail_height = rendered["variants"][THUMBNAIL]
+    fields = {
+        "thumbnail_url": variant_url(file_url, THUMBNAIL),
+        "thumbnail_width": thumbnail_width,
+        "thumbnail_height": thumbnail_height,
+        "preview_url": variant_url(file_url, PREVIEW)
+    }
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Message).where(Message.id == message_id).values(
+                image_width=rendered["width"],
+                image_height=rendered["height"],
+                **fields
+            )
+        )
+        await db.commit()
+    if not result.rowcount:
+        return  # deleted while rendering
+    history_cache.update_message(room_id, message_id, **fields)
+    change_versions.bump(room_key(room_id))
+    await manager.broadcast_to_room(room_id, {
+        "type": "message_updated",
+        "room_id": room_id,
+        "message_id": message_id,
+        **fields
+    })
+
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     room_id: int = Form(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    
-    if file_size > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-    
     allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx', '.txt'}
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail="File type not allowed")
     
-    upload_dir = Path("uploads")
-    upload_dir.mkdir(exist_ok=True)
-    
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = upload_dir / unique_filename
+    # Chunked copy off the event loop; oversized files are cut off mid-stream with a 413
+    upload = await receive_upload(file, Path(settings.upload_dir) / OBJECTS_DIR, settings.max_file_size)
     
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    file_url = f"/uploads/{unique_filename}"
+    # Identical bytes share one stored copy under an immutable, content-addressed URL
+    attachment = await store_attachment(db, upload, file_ext)
+    file_url = attachment_url(attachment)
+    attachment_id = attachment.id  # read now; a rollback below would expire the instance
     message_content = f"📎 {file.filename}"
     
     db_message = Message(
@@ -176,11 +256,20 @@ async def upload_file(
         room_id=room_id,
         message_type="file",
         file_url=file_url,
-        file_name=file.filename
+        file_name=file.filename,
+        attachment_id=attachment_id
     )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    history_cache.invalidate(room_id)
+    try:
+        await message_writer.insert(db, db_message)
+    except Exception:
+        # Give back the reference store_attachment took, or the stored file would never be collected
+        await db.rollback()
+        async with store_lock:
+            orphaned_file = await release_attachment(db, attachment_id)
+            await db.commit()
+            await collect_garbage(db, orphaned_file)
+        raise
     
     # FIX: Added all missing fields for file upload response
     message_data = {
@@ -189,17 +278,30 @@ async def upload_file(
         "user_id": db_message.user_id,
         "room_id": db_message.room_id,
         "message_type": "file",
-        "file_url": file_url,
-        "file_name": file.filename,
-        "timestamp": db_message.timestamp,
+        "timestamp": as_utc(db_message.timestamp),
         "username": current_user.username,
         "avatar_color": current_user.avatar_color,
         "avatar_url": current_user.avatar_url,  # REQUIRED FIX
+        "avatar_thumbnail_url": current_user.avatar_thumbnail_url,
         "reply_to": None,                       # REQUIRED FIX
         "is_edited": False,                     # REQUIRED FIX
         "is_read": False,                       # REQUIRED FIX
+        "file_url": file_url,
+        "file_name": file.filename,
+        # Filled in by render_message_images once the variants exist
+        "thumbnail_url": None,
+        "thumbnail_width": None,
+        "thumbnail_height": None,
+        "preview_url": None,
         "reactions": []
     }
     
+    history_cache.append(room_id, message_data)
+    change_versions.bump(room_key(room_id))
     await manager.broadcast_new_message(room_id, message_data)
+    
+    # Thumbnail/preview rendering runs after the response, in the thumbnail process pool
+    stored_file = Path(settings.upload_dir) / attachment.storage_path
+    if is_image(stored_file):
+        background_tasks.add_task(render_message_images, db_message.id, room_id, stored_file, file_url)
     return message_data
\ No newline at end of file
@@ -1,35 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, or_
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, or_, func, tuple_
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
+from ..database import get_db, get_read_db
 from ..models.room import Room, room_members, room_invites
 from ..models.user import User
-from ..models.message import Message 
+from ..models.message import Message, Reaction
 from ..schemas.room import RoomCreate, RoomResponse, RoomInviteCreate, RoomInviteResponse
-from ..schemas.message import MessageResponse
-from ..core.security import get_current_user
+from ..schemas.message import MessageResponse, MessageSearchResult
+from ..schemas.auth import AuthenticatedUser
+from ..core.security import get_authenticated_user
+from ..core.history_cache import history_cache
+from ..core.etags import change_versions, conditional_response, room_key, ROOMS_KEY, PROFILES_KEY
+from ..core.search import build_match_query, search_messages, search_supported
+from ..utils.serialization import fast_json_response
+from ..utils.helpers import as_utc, encode_cursor, decode_cursor, encode_score_cursor, decode_score_cursor
 
 # Mounted at /api/rooms in main.py
 router = APIRouter()
 
+def member_count_column():
+    # Counted per listed room through the (room_id, user_id) index instead of
+    # loading member lists or grouping the whole room_members table
+    return select(func.count()).where(
+        room_members.c.room_id == Room.id
+    ).correlate(Room).scalar_subquery().label("member_count")
+
+def is_room_member(db: Session, room_id: int, user_id: int) -> bool:
+    return db.execute(
+        select(room_members.c.user_id).where(
+            (room_members.c.room_id == room_id) &
+            (room_members.c.user_id == user_id)
+        ).limit(1)
+    ).first() is not None
+
+def add_room_member(db: Session, room_id: int, user_id: int):
+    db.execute(room_members.insert().values(room_id=room_id, user_id=user_id))
+
+def set_history_cursors(response: Response, page: List[dict]):
+    if page:
+        oldest, newest = page[0], page[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor("before", oldest["timestamp"], oldest["id"])
+        response.headers["X-Prev-Cursor"] = encode_cursor("after", newest["timestamp"], newest["id"])
+
+def search_results(
+    db: Session,
+    response: Response,
+    q: str,
+    cursor: Optional[str],
+    limit: int,
+    room_id: Optional[int] = None,
+    member_id: Optional[int] = None
+) -> List[dict]:
+    if not search_supported(db.get_bind()):
+        raise HTTPException(status_code=501, detail="Search is only available on SQLite")
+    after = None
+    if cursor is not None:
+        after = decode_score_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    match = build_match_query(q)
+    if match is None:
+        return []
+
+    hits = search_messages(db, match, room_id=room_id, member_id=member_id, after=after, limit=limit)
+    if len(hits) == limit:
+        last = hits[-1]
+        response.headers["X-Next-Cursor"] = encode_score_cursor(last["score"], last["id"])
+
+    messages = db.query(Message).options(joinedload(Message.user)).filter(
+        Message.id.in_([hit["id"] for hit in hits])
+    ).all()
+    messages_by_id = {msg.id: msg for msg in messages}
+
+    result = []
+    for hit in hits:
+        msg = messages_by_id[hit["id"]]
+        user = msg.user
+        result.append({
+            "id": msg.id,
+            "room_id": msg.room_id,
+            "user_id": msg.user_id,
+            "username": user.username if user else "Unknown",
+            "avatar_url": user.avatar_url if user else "default-avatar.png",
+            "avatar_color": user.avatar_color if user else "#6366f1",
+            "content": msg.content,
+            "message_type": msg.message_type,
+            "file_url": msg.file_url,
+            "file_name": msg.file_name,
+            "timestamp": as_utc(msg.timestamp),
+            "snippet": hit["snippet"]
+        })
+    return result
+
 # --- ROOM MANAGEMENT ENDPOINTS ---
 
 @router.get("/", response_model=List[RoomResponse])
 def get_rooms(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
+    # Private rooms make the list per user
+    not_modified = conditional_response(
+        request, response, change_versions.etag(ROOMS_KEY, vary=str(current_user.id))
+    )
+    if not_modified:
+        return not_modified
+
     # Fetch public rooms OR private rooms the user belongs to
-    rooms = db.query(Room).filter(
+    rows = db.query(
+        Room.id,
+        Room.name,
+        Room.description,
+        Room.room_type,
+        Room.icon,
+        Room.created_by,
+        Room.created_at,
+        member_count_column()
+    ).filter(
         or_(
             Room.room_type == "public",
             Room.members.any(id=current_user.id)
         )
-    ).distinct().all()
+    ).all()
     
     result = []
-    for room in rooms:
+    for room in rows:
         result.append({
             "id": room.id,
             "name": room.name,
@@ -38,15 +136,15 @@ def get_rooms(
             "icon": room.icon,
             "created_by": room.created_by,
             "created_at": room.created_at,
-            "member_count": len(room.members)
+            "member_count": room.member_count
         })
-    return result
+    return fast_json_response(result, response)
 
 @router.post("/", response_model=RoomResponse)
 def create_room(
     room: RoomCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     db_room = Room(
         name=room.name,
@@ -56,12 +154,13 @@ def create_room(
         created_by=current_user.id
     )
     db.add(db_room)
-    db.commit()
-    db.refresh(db_room)
+    db.flush()
     
     # Add creator as first member
-    db_room.members.append(current_user)
+    add_room_member(db, db_room.id, current_user.id)
     db.commit()
+    change_versions.bump(ROOMS_KEY)
+    db.refresh(db_room)
     
     return {
         "id": db_room.id,
@@ -71,15 +170,15 @@ def create_room(
         "icon": db_room.icon,
         "created_by": db_room.created_by,
         "created_at": db_room.created_at,
-        "member_count": len(db_room.members)
+        "member_count": 1
     }
 
 # --- INVITE ENDPOINTS (Must come before /{room_id}) ---
 
 @router.get("/invites", response_model=List[RoomInviteResponse])
 def get_my_invites(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     invites = db.execute(
         select(room_invites).where(
@@ -108,7 +207,7 @@ def get_my_invites(
 def accept_invite(
     invite_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     invite = db.execute(
         select(room_invites).where(room_invites.c.id == invite_id)
@@ -125,19 +224,21 @@ def accept_invite(
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    room.members.append(current_user)
+    if not is_room_member(db, room.id, current_user.id):
+        add_room_member(db, room.id, current_user.id)
     
     db.execute(
         room_invites.update().where(room_invites.c.id == invite_id).values(status='accepted')
     )
     db.commit()
+    change_versions.bump(ROOMS_KEY)
     return {"message": f"Joined {room.name}"}
 
 @router.post("/invites/{invite_id}/decline")
 def decline_invite(
     invite_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     invite = db.execute(
         select(room_invites).where(room_invites.c.id == invite_id)
@@ -156,11 +257,43 @@ def decline_invite(
 
 # --- SPECIFIC ROOM ENDPOINTS ---
 
+# --- SEARCH (Must come before /{room_id}) ---
+
+@router.get("/search", response_model=List[MessageSearchResult])
+def search_my_rooms(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    # Best matches first across every room the caller is a member of
+    return search_results(db, response, q, cursor, limit, member_id=current_user.id)
+
+@router.get("/{room_id}/search", response_model=List[MessageSearchResult])
+def search_room(
+    room_id: int,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    room_type = db.query(Room.room_type).filter(Room.id == room_id).scalar()
+    if room_type is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    # Private rooms are searchable by their members only
+    if room_type == "private" and not is_room_member(db, room_id, current_user.id):
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+    return search_results(db, response, q, cursor, limit, room_id=room_id)
+
 @router.get("/{room_id}", response_model=RoomResponse)
 def get_room(
     room_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
@@ -173,63 +306,163 @@ def get_room(
         "icon": room.icon,
         "created_by": room.created_by,
         "created_at": room.created_at,
-        "member_count": len(room.members)
+        "member_count": db.execute(
+            select(func.count()).select_from(room_members).where(room_members.c.room_id == room_id)
+        ).scalar()
     }
 
 # MOVED FROM MESSAGES.PY: Get messages for a specific room
 @router.get("/{room_id}/messages", response_model=List[MessageResponse])
 def get_room_messages(
     room_id: int,
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
-    messages = db.query(Message).filter(
-        Message.room_id == room_id
-    ).order_by(Message.timestamp.desc()).offset(skip).limit(limit).all()
-    
+    """Return a page of room history, oldest first.
+
+    Pages are walked with keyset pagination over (timestamp, id): pass
+    ``before_id``/``after_id`` or the opaque ``cursor`` from a previous
+    response. ``X-Next-Cursor`` points at older messages and
+    ``X-Prev-Cursor`` at newer ones. Plain ``skip``/``limit`` still works
+    for older clients.
+    """
+    # The tag covers every page of the room; messages embed author profile fields
+    not_modified = conditional_response(
+        request, response, change_versions.etag(room_key(room_id), PROFILES_KEY)
+    )
+    if not_modified:
+        return not_modified
+
+    direction, anchor = None, None
+    if cursor is not None:
+        decoded = decode_cursor(cursor)
+        if decoded is None or decoded[0] not in ("before", "after"):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        direction, anchor_ts, anchor_id = decoded
+        anchor = (anchor_ts, anchor_id)
+    elif before_id is not None or after_id is not None:
+        direction = "before" if before_id is not None else "after"
+        anchor_id = before_id if before_id is not None else after_id
+        anchor_ts = db.query(Message.timestamp).filter(
+            Message.id == anchor_id,
+            Message.room_id == room_id
+        ).scalar()
+        if anchor_ts is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        anchor = (anchor_ts, anchor_id)
+
+    # Opening a room asks for the latest page; serve it from the in-memory tail when warm
+    latest_page = direction is None and skip == 0
+    if latest_page:
+        cached = history_cache.latest(room_id, limit)
+        if cached is not None:
+            set_history_cursors(response, cached)
+            return fast_json_response(cached, response)
+        cache_version = history_cache.version(room_id)
+
+    # Plain column rows straight into the wire dicts; no ORM objects for the page
+    position = tuple_(Message.timestamp, Message.id)
+    query = db.query(
+        Message.id,
+        Message.content,
+        Message.user_id,
+        Message.room_id,
+        Message.message_type,
+        Message.timestamp,
+        Message.file_url,
+        Message.file_name,
+        Message.thumbnail_url,
+        Message.thumbnail_width,
+        Message.thumbnail_height,
+        Message.preview_url,
+        User.username,
+        User.avatar_color,
+        User.avatar_url,
+        User.avatar_thumbnail_url
+    ).outerjoin(User, User.id == Message.user_id).filter(Message.room_id == room_id)
+    if direction == "after":
+        messages = query.filter(position > anchor).order_by(
+            Message.timestamp.asc(), Message.id.asc()
+        ).limit(limit).all()
+    else:
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+        if direction == "before":
+            query = query.filter(position < anchor)
+        else:
+            query = query.offset(skip)
+        messages = query.limit(limit).all()
+        messages.reverse()
+
+    # Fetch every reaction on the page (with its username) in one query
+    reactions_by_message = {msg.id: [] for msg in messages}
+    if reactions_by_message:
+        reaction_rows = db.query(
+            Reaction.id,
+            Reaction.emoji,
+            Reaction.user_id,
+            Reaction.created_at,
+            Reaction.message_id,
+            User.username
+        ).outerjoin(User, User.id == Reaction.user_id).filter(
+            Reaction.message_id.in_(list(reactions_by_message))
+        ).order_by(Reaction.id).all()
+        for r in reaction_rows:
+            reactions_by_message[r.message_id].append({
+                "id": r.id,
+                "emoji": r.emoji,
+                "user_id": r.user_id,
+                "username": r.username or "Unknown",
+                "created_at": as_utc(r.created_at)
+            })
+
     result = []
-    for msg in reversed(messages):
-        user = db.query(User).filter(User.id == msg.user_id).first()
+    for msg in messages:
         result.append({
             "id": msg.id,
             "content": msg.content,
             "user_id": msg.user_id,
             "room_id": msg.room_id,
             "message_type": msg.message_type,
-            "timestamp": msg.timestamp,
-            "username": user.username if user else "Unknown",
-            "avatar_color": user.avatar_color if user else "#6366f1",
+            # Same UTC form as the dicts appended by the write paths, so cached and fresh pages match
+            "timestamp": as_utc(msg.timestamp),
+            "username": msg.username or "Unknown",
+            "avatar_color": msg.avatar_color or "#6366f1",
             
             # --- CRITICAL FIX START ---
             # [cite_start]These fields are required by MessageResponse schema [cite: 131]
-            "avatar_url": user.avatar_url if user else "default-avatar.png",
+            "avatar_url": msg.avatar_url or "default-avatar.png",
+            "avatar_thumbnail_url": msg.avatar_thumbnail_url,
             "reply_to": None,
             "is_edited": False,
             "is_read": False,
             # --- CRITICAL FIX END ---
             
-            "file_url": msg.file_url if hasattr(msg, 'file_url') else None,
-            "file_name": msg.file_name if hasattr(msg, 'file_name') else None,
-            "reactions": [
-                {
-                    "id": r.id,
-                    "emoji": r.emoji,
-                    "user_id": r.user_id,
-                    "username": r.user.username if r.user else "Unknown", # Added safety
-                    "created_at": r.created_at, # Added created_at
-                    "message_id": r.message_id
-                } for r in msg.reactions
-            ]
+            "file_url": msg.file_url,
+            "file_name": msg.file_name,
+            "thumbnail_url": msg.thumbnail_url,
+            "thumbnail_width": msg.thumbnail_width,
+            "thumbnail_height": msg.thumbnail_height,
+            "preview_url": msg.preview_url,
+            "reactions": reactions_by_message[msg.id]
         })
-    return result
+
+    set_history_cursors(response, result)
+    if latest_page:
+        history_cache.fill(room_id, result, complete=len(messages) < limit, version=cache_version)
+    return fast_json_response(result, response)
 
 @router.post("/{room_id}/join")
 def join_room(
     room_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
@@ -238,11 +471,12 @@ def join_room(
     if room.room_type == "private":
         raise HTTPException(status_code=403, detail="Cannot join private room without invite")
     
-    if current_user in room.members:
+    if is_room_member(db, room_id, current_user.id):
         return {"message": "Already a member"}
     
-    room.members.append(current_user)
+    add_room_member(db, room_id, current_user.id)
     db.commit()
+    change_versions.bump(ROOMS_KEY)
     return {"message": f"Joined {room.name}"}
 
 @router.post("/{room_id}/invite", response_model=dict)
@@ -250,7 +484,7 @@ def invite_to_room(
     room_id: int,
     invite: RoomInviteCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
@@ -266,7 +500,7 @@ def invite_to_room(
     if not invited_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if invited_user in room.members:
+    if is_room_member(db, room_id, invited_user.id):
         raise HTTPException(status_code=400, detail="User is already a member")
     
     existing_invite = db.execute(
@@ -1,24 +1,40 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException, Query, Request, Response
+from sqlalchemy import and_, func, or_, tuple_, update
 from sqlalchemy.orm import Session
-from typing import List
-import shutil
+from typing import List, Optional
+import hashlib
 import os
+import sys
 from pathlib import Path
-from ..database import get_db
+from ..database import AsyncSessionLocal, get_db, get_read_db
 from ..models.user import User
-from ..schemas.user import UserResponse, UserUpdate
-from ..core.security import get_current_user
+from ..schemas.user import UserResponse, UserSummary, UserUpdate
+from ..schemas.auth import AuthenticatedUser
+from ..core.security import get_current_user, get_authenticated_user, invalidate_user_cache
+from ..core.presence import presence
+from ..core.history_cache import history_cache
+from ..utils.serialization import fast_json_response
+from ..core.uploads import copy_upload
+from ..core.thumbnails import PREVIEW, THUMBNAIL, avatar_variants, generate_variants, is_image, variant_url
+from ..core.etags import change_versions, conditional_response, PROFILES_KEY, PRESENCE_KEY
+from ..utils.helpers import encode_key_cursor, decode_key_cursor
 from ..config import get_settings
 
 router = APIRouter()
 settings = get_settings()
 
+def to_user_response(user: User) -> UserResponse:
+    # is_online comes from the in-memory presence registry; the column lags by a flush tick
+    response = UserResponse.model_validate(user)
+    response.is_online = presence.is_online(user.id, default=user.is_online)
+    return response
+
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return current_user
+def get_current_user_info(current_user: User = Depends(get_current_user)):
+    return to_user_response(current_user)
 
 @router.put("/me", response_model=UserResponse)
-async def update_user_profile(
+def update_user_profile(
     user_data: UserUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -27,15 +43,48 @@ async def update_user_profile(
         current_user.full_name = user_data.full_name
     if user_data.bio is not None:
         current_user.bio = user_data.bio
-    if user_data.avatar_url is not None:
+    if user_data.avatar_url is not None and user_data.avatar_url != current_user.avatar_url:
         current_user.avatar_url = user_data.avatar_url
+        # Variants belong to the previous image
+        current_user.avatar_thumbnail_url = None
+        current_user.avatar_preview_url = None
     
     db.commit()
     db.refresh(current_user)
-    return current_user
+    invalidate_user_cache(current_user.id)
+    history_cache.update_author(
+        current_user.id,
+        avatar_url=current_user.avatar_url,
+        avatar_thumbnail_url=current_user.avatar_thumbnail_url
+    )
+    change_versions.bump(PROFILES_KEY)
+    return to_user_response(current_user)
+
+async def render_avatar_images(user_id: int, source: Path, avatar_url: str):
+    try:
+        rendered = await generate_variants(source, avatar_variants())
+    except Exception as e:
+        print(f"Avatar thumbnail generation failed for user {user_id}: {e}")
+        return
+    if not rendered["variants"]:
+        return  # animated; keep serving the original
+    async with AsyncSessionLocal() as db:
+        # Skipped if another avatar replaced this one while it was rendering
+        result = await db.execute(
+            update(User).where(User.id == user_id, User.avatar_url == avatar_url).values(
+                avatar_thumbnail_url=variant_url(avatar_url, THUMBNAIL),
+                avatar_preview_url=variant_url(avatar_url, PREVIEW)
+            )
+        )
+        await db.commit()
+    if result.rowcount:
+        invalidate_user_cache(user_id)
+        history_cache.update_author(user_id, avatar_thumbnail_url=variant_url(avatar_url, THUMBNAIL))
+        change_versions.bump(PROFILES_KEY)
 
 @router.post("/upload-avatar")
-async def upload_avatar(
+def upload_avatar(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -48,35 +97,149 @@ async def upload_avatar(
     upload_dir = Path(settings.upload_dir) / "avatars"
     upload_dir.mkdir(parents=True, exist_ok=True)
     
-    # Save file
+    # Save file (chunked copy, swapped in atomically; sync handlers already run off the event loop)
     file_extension = file.filename.split(".")[-1]
     file_name = f"{current_user.id}_{current_user.username}.{file_extension}"
-    file_path = upload_dir / file_name
+    upload = copy_upload(file.file, upload_dir, settings.max_file_size)
+    upload.move_to(upload_dir / file_name)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Update user avatar URL
+    # Update user avatar URL; its thumbnail and preview follow from a background job
     current_user.avatar_url = f"/uploads/avatars/{file_name}"
+    current_user.avatar_thumbnail_url = None
+    current_user.avatar_preview_url = None
     db.commit()
+    invalidate_user_cache(current_user.id)
+    history_cache.update_author(
+        current_user.id,
+        avatar_url=current_user.avatar_url,
+        avatar_thumbnail_url=current_user.avatar_thumbnail_url
+    )
+    change_versions.bump(PROFILES_KEY)
+    if is_image(upload_dir / file_name):
+        background_tasks.add_task(render_avatar_images, current_user.id, upload_dir / file_name, current_user.avatar_url)
     
     return {"avatar_url": current_user.avatar_url}
 
+# SQLite's lower() only folds ASCII, so the query text is folded the same way as the indexed column
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def fold_case(db: Session, text: str) -> str:
+    if db.get_bind().dialect.name == "sqlite":
+        return text.translate(ASCII_LOWER)
+    return text.lower()
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """The smallest string above everything starting with ``prefix``, or None if there is none."""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    next_code = ord(prefix[-1]) + 1
+    if 0xD800 <= next_code <= 0xDFFF:
+        next_code = 0xE000  # surrogates can't be encoded; the next real character follows them
+    return prefix[:-1] + chr(next_code)
+
+def prefix_range(column, prefix: str):
+    # A range on lower(column) rather than LIKE, so the expression index is searched, not scanned
+    lowered = func.lower(column)
+    upper = prefix_upper_bound(prefix)
+    if upper is None:
+        return lowered >= prefix
+    return and_(lowered >= prefix, lowered < upper)
+
+def user_page(db: Session, columns: list, response: Response, q: Optional[str], cursor: Optional[str], limit: int):
+    """One page of users ordered by username (case-insensitive), optionally prefix-filtered.
+
+    ``q`` matches the start of the username or the full name. The next
+    page's cursor goes out in ``X-Next-Cursor``, like room history.
+    """
+    sort_key = func.lower(User.username)
+    query = db.query(*columns, sort_key.label("sort_key"))
+    prefix = fold_case(db, (q or "").strip())
+    if prefix:
+        query = query.filter(or_(prefix_range(User.username, prefix), prefix_range(User.full_name, prefix)))
+    if cursor is not None:
+        decoded = decode_key_cursor(cursor)
+        if decoded is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        key, last_id = decoded
+        # The plain bound lets SQLite seek the index; the row-value compare alone would scan it
+        query = query.filter(sort_key >= key, tuple_(sort_key, User.id) > (key, last_id))
+    rows = query.order_by(sort_key, User.id).limit(limit).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_key_cursor(rows[-1].sort_key, rows[-1].id)
+    return rows
+
 @router.get("/", response_model=List[UserResponse])
-async def get_all_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+def get_all_users(
+    request: Request,
+    response: Response,
+    q: Optional[str] = Query(None, max_length=50),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
-    users = db.query(User).all()
-    return users
+    # Every page/filter is its own representation, so the query string is part of the ETag
+    query_string = request.url.query
+    vary = hashlib.sha1(query_string.encode()).hexdigest()[:12] if query_string else ""
+    not_modified = conditional_response(
+        request, response, change_versions.etag(PROFILES_KEY, PRESENCE_KEY, vary=vary)
+    )
+    if not_modified:
+        return not_modified
+    rows = user_page(db, [
+        User.id,
+        User.username,
+        User.email,
+        User.full_name,
+        User.bio,
+        User.avatar_url,
+        User.avatar_thumbnail_url,
+        User.avatar_color,
+        User.is_online,
+        User.last_seen,
+        User.created_at
+    ], response, q, cursor, limit)
+    result = []
+    for row in rows:
+        user = row._asdict()
+        del user["sort_key"]
+        user["is_online"] = presence.is_online(row.id, default=row.is_online)
+        result.append(user)
+    return fast_json_response(result, response)
+
+# Must come before /{user_id}
+@router.get("/search", response_model=List[UserSummary])
+def search_users(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=50),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
+):
+    # Compact rows for the invite picker: no profile text, no presence
+    rows = user_page(db, [
+        User.id,
+        User.username,
+        User.avatar_url,
+        User.avatar_thumbnail_url,
+        User.avatar_color
+    ], response, q, cursor, limit)
+    result = []
+    for row in rows:
+        user = row._asdict()
+        del user["sort_key"]
+        result.append(user)
+    return fast_json_response(result, response)
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user_by_id(
+def get_user_by_id(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user)
 ):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return to_user_response(user)
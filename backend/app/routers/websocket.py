@@ -1,43 +1,62 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, status
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.user import User
-from ..core.websocket_manager import manager
-from ..core.security import settings
-from jose import jwt, JWTError
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query, status
+from pydantic import ValidationError
+from ..core.websocket_manager import ClientConnection, manager
+from ..core.presence import presence
+from ..core.security import authenticate_token
+from ..database import AsyncSessionLocal
+from ..schemas import AuthenticatedUser, MessageCreate, ReactionCreate
+from .messages import post_message, remove_message, toggle_reaction
 import json
 
 router = APIRouter()
 
+# Frames that write to the database, the socket equivalents of the /api/messages endpoints
+WRITE_FRAME_TYPES = {"send_message", "react", "delete"}
+
+async def handle_write_frame(connection: ClientConnection, user: AuthenticatedUser, frame: dict):
+    # Acked to this socket with the client's correlation id; room members get the usual broadcast
+    frame_type = frame["type"]
+    ack = {"type": "ack", "action": frame_type, "client_id": frame.get("client_id")}
+    try:
+        async with AsyncSessionLocal() as db:
+            if frame_type == "send_message":
+                # Same payload as POST /api/messages/; extra keys (type, client_id) are ignored
+                message_data = await post_message(db, MessageCreate.model_validate(frame), user)
+                ack.update(ok=True, id=message_data["id"], timestamp=message_data["timestamp"])
+            elif frame_type == "react":
+                reaction = ReactionCreate.model_validate(frame)
+                reaction_data = await toggle_reaction(db, reaction.message_id, reaction.emoji, user)
+                ack.update(ok=True, id=reaction_data["id"], message_id=reaction.message_id)
+            else:
+                message_id = frame.get("message_id")
+                if not isinstance(message_id, int):
+                    raise HTTPException(status_code=422, detail="message_id is required")
+                await remove_message(db, message_id, user)
+                ack.update(ok=True, id=message_id)
+    except HTTPException as e:
+        ack.update(ok=False, status=e.status_code, error=e.detail)
+    except ValidationError as e:
+        ack.update(ok=False, status=422, error=e.errors(include_url=False, include_context=False))
+    await manager.send_to_connection(connection, ack)
+
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
-    token: str = Query(...),
-    db: Session = Depends(get_db)
+    token: str = Query(...)
 ):
-    # 1. Validate Token explicitly before accepting connection
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
-    except JWTError:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-        return
-
-    # 2. Get User from DB
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+    # 1. Validate Token explicitly before accepting connection (cached after first use)
+    user = await authenticate_token(token)
+    if user is None:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
-    # 3. Accept connection and pass username for typing indicator logic
-    await manager.connect(websocket, user.id, user.username)
+    # 2. Accept connection and pass username for typing indicator logic
+    was_online = manager.is_online(user.id)
+    connection = await manager.connect(websocket, user.id, user.username)
     
-    # FIX: Update User Status to Online
-    user.is_online = True
-    db.commit()
+    # FIX: Update User Status to Online (first device only; persisted in batches)
+    if not was_online:
+        presence.mark_online(user.id)
     
     try:
         while True:
@@ -46,27 +65,27 @@ async def websocket_endpoint(
             
             if message_data.get("type") == "join_room":
                 room_id = message_data.get("room_id")
-                await manager.join_room(user.id, room_id)
+                await manager.join_room(connection, room_id)
                 
             elif message_data.get("type") == "leave_room":
                 room_id = message_data.get("room_id")
-                await manager.leave_room(user.id, room_id)
+                await manager.leave_room(connection, room_id)
                 
             elif message_data.get("type") == "typing":
                 room_id = message_data.get("room_id")
                 is_typing = message_data.get("is_typing", False)
-                # Pass the username we retrieved earlier
-                await manager.broadcast_typing(room_id, user.id, user.username, is_typing)
+                # Coalesced per room and broadcast on the manager's flush tick
+                manager.set_typing(room_id, user.id, is_typing)
+                
+            elif message_data.get("type") in WRITE_FRAME_TYPES:
+                await handle_write_frame(connection, user, message_data)
                 
     except WebSocketDisconnect:
-        await manager.disconnect(user.id)
-        # FIX: Update User Status to Offline
-        user.is_online = False
-        db.commit()
+        # FIX: Update User Status to Offline once the last device is gone
+        # (the manager hands the rooms to presence; a send error may have removed it already)
+        await manager.disconnect(connection)
         
     except Exception as e:
         print(f"WebSocket error for user {user.id}: {e}")
-        await manager.disconnect(user.id)
         # FIX: Update User Status to Offline on error
-        user.is_online = False
-        db.commit()
\ No newline at end of file
+        await manager.disconnect(connection)
\ No newline at end of file
@@ -1,16 +1,19 @@
-from .user import UserCreate, UserLogin, UserResponse, UserUpdate
-from .message import MessageCreate, MessageResponse, ReactionCreate, ReactionResponse
-from .auth import Token, TokenData
+from .user import UserCreate, UserLogin, UserResponse, UserSummary, UserUpdate
+from .message import MessageCreate, MessageResponse, MessageSearchResult, ReactionCreate, ReactionResponse
+from .auth import Token, TokenData, AuthenticatedUser
 
 __all__ = [
     'UserCreate',
     'UserLogin',
     'UserResponse',
+    'UserSummary',
     'UserUpdate',
     'MessageCreate',
     'MessageResponse',
+    'MessageSearchResult',
     'ReactionCreate',
     'ReactionResponse',
     'Token',
-    'TokenData'
+    'TokenData',
+    'AuthenticatedUser'
 ]
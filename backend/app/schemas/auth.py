@@ -8,3 +8,15 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+
+class AuthenticatedUser(BaseModel):
+    """Identity of the caller, cached per token so auth needs no DB round trip"""
+    id: int
+    username: str
+    full_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    avatar_thumbnail_url: Optional[str] = None
+    avatar_color: Optional[str] = None
+
+    class Config:
+        from_attributes = True
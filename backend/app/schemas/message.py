@@ -1,9 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 
+# Also bounds the room frames fanned out over the backplane
+MAX_MESSAGE_LENGTH = 10000
+
 class MessageCreate(BaseModel):
-    content: str
+    content: str = Field(..., max_length=MAX_MESSAGE_LENGTH)
     room_id: int
     message_type: str = "text"
     file_url: Optional[str] = None
@@ -29,9 +32,15 @@ class MessageResponse(BaseModel):
     message_type: str
     file_url: Optional[str] = None
     file_name: Optional[str] = None  # ADDED: This ensures file_name is passed to frontend
+    # Image uploads: small WebP for the message list (None until rendered) and a larger preview
+    thumbnail_url: Optional[str] = None
+    thumbnail_width: Optional[int] = None
+    thumbnail_height: Optional[int] = None
+    preview_url: Optional[str] = None
     user_id: int
     username: str
     avatar_url: str
+    avatar_thumbnail_url: Optional[str] = None  # small square variant of the author's avatar
     avatar_color: str
     room_id: int
     reply_to: Optional[int]
@@ -41,4 +50,18 @@ class MessageResponse(BaseModel):
     reactions: List[ReactionResponse] = []
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class MessageSearchResult(BaseModel):
+    id: int
+    room_id: int
+    user_id: int
+    username: str
+    avatar_url: str
+    avatar_color: str
+    content: str
+    message_type: str
+    file_url: Optional[str] = None
+    file_name: Optional[str] = None
+    timestamp: datetime
+    snippet: str  # HTML-escaped matched text with hits wrapped in <mark></mark>
@@ -18,6 +18,7 @@ class UserResponse(UserBase):
     id: int
     bio: Optional[str] = None
     avatar_url: str
+    avatar_thumbnail_url: Optional[str] = None
     avatar_color: str
     is_online: bool
     last_seen: datetime
@@ -26,6 +27,14 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserSummary(BaseModel):
+    # Compact row for pickers and mentions
+    id: int
+    username: str
+    avatar_url: str
+    avatar_thumbnail_url: Optional[str] = None
+    avatar_color: str
+
 class UserUpdate(BaseModel):
     full_name: Optional[str] = None
     bio: Optional[str] = None
@@ -1,6 +1,8 @@
-from typing import Optional
-from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import base64
 import hashlib
+import json
 import secrets
 
 def generate_unique_id() -> str:
@@ -32,6 +34,14 @@ def format_timestamp(dt: datetime) -> str:
     else:
         return dt.strftime("%b %d, %Y")
 
+def as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Timezone-aware UTC datetime; SQLite hands stored UTC values back naive"""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
 def validate_file_extension(filename: str, allowed_extensions: set) -> bool:
     """Validate file extension"""
     if '.' not in filename:
@@ -42,3 +52,45 @@ def validate_file_extension(filename: str, allowed_extensions: set) -> bool:
 def get_file_size_mb(size_bytes: int) -> float:
     """Convert bytes to MB"""
     return size_bytes / (1024 * 1024)
+
+def encode_cursor(direction: str, timestamp: datetime, item_id: int) -> str:
+    """Encode a keyset position into an opaque URL-safe cursor token"""
+    raw = json.dumps({"d": direction, "t": timestamp.isoformat(), "i": item_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Optional[Tuple[str, datetime, int]]:
+    """Decode a cursor token into (direction, timestamp, id), or None if invalid"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return data["d"], datetime.fromisoformat(data["t"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def encode_score_cursor(score: float, item_id: int) -> str:
+    """Encode a (relevance score, id) position for search result pagination"""
+    raw = json.dumps({"s": score, "i": item_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_score_cursor(token: str) -> Optional[Tuple[float, int]]:
+    """Decode a search cursor into (score, id), or None if invalid"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(data["s"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def encode_key_cursor(key: str, item_id: int) -> str:
+    """Encode a (sort key, id) position for alphabetical listings"""
+    raw = json.dumps({"k": key, "i": item_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_key_cursor(token: str) -> Optional[Tuple[str, int]]:
+    """Decode a listing cursor into (sort key, id), or None if invalid"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(data["k"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        return None
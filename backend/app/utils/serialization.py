@@ -0,0 +1,37 @@
+from typing import Any
+from fastapi import Response
+import orjson
+from ..config import get_settings
+
+settings = get_settings()
+
+# Matches Pydantic's datetime output (UTC as "Z") so WebSocket frames and REST bodies agree
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+def dumps(data: Any) -> bytes:
+    """Serialize to JSON bytes; datetimes are encoded natively as ISO 8601"""
+    return orjson.dumps(data, option=ORJSON_OPTIONS)
+
+def dumps_text(data: Any) -> str:
+    """Serialize to a JSON string, e.g. for a WebSocket text frame"""
+    return orjson.dumps(data, option=ORJSON_OPTIONS).decode()
+
+class FastJSONResponse(Response):
+    """JSON body encoded once by orjson"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def fast_json_response(content: Any, response: Response) -> Any:
+    """Send ``content`` pre-encoded, skipping response_model validation.
+
+    The handler keeps its ``response_model`` for the OpenAPI schema, but a
+    returned Response bypasses FastAPI's re-validation and jsonable_encoder
+    pass, so ``content`` must already have exactly the schema's shape.
+    Headers set on the injected ``response`` are carried over. With
+    ``fast_json_responses`` off, ``content`` goes through the model as usual.
+    """
+    if not settings.fast_json_responses:
+        return content
+    return FastJSONResponse(content, headers=dict(response.headers))
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import List, Tuple
+
+# Settings and engines are built when app modules are imported, so point them at a
+# scratch database and upload directory before anything from app is imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="chatflow-tests-")
+TEST_DATABASE = os.path.join(SCRATCH_DIR, "test.db")
+os.environ["SECRET_KEY"] = "test-secret"
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DATABASE}"
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ["UPLOAD_DIR"] = os.path.join(SCRATCH_DIR, "uploads")
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.main import app
+from app.core.history_cache import history_cache
+
+SEED_MESSAGES = 60
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+class StatementLog:
+    """SQL statements (with parameters) executed on any engine while recording."""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, object]] = []
+
+    def __len__(self):
+        return len(self.statements)
+
+@contextmanager
+def record_statements():
+    log = StatementLog()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log.statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield log
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+def register(client: TestClient, username: str) -> dict:
+    response = client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "secret1",
+        "full_name": username.title()
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def seeded_room(client):
+    """A public room with three members, SEED_MESSAGES messages and reactions from several users."""
+    owner, second, third = (register(client, name) for name in ("alice", "bobby", "carol"))
+    room_id = client.post("/api/rooms/", json={
+        "name": "general", "description": "seeded", "room_type": "public"
+    }, headers=owner).json()["id"]
+    for headers in (second, third):
+        assert client.post(f"/api/rooms/{room_id}/join", headers=headers).status_code == 200
+
+    members = (owner, second, third)
+    for index in range(SEED_MESSAGES):
+        author = members[index % 3]
+        message = client.post("/api/messages/", json={
+            "content": f"seed message {index}", "room_id": room_id
+        }, headers=author).json()
+        # Reactions from different users, so a page spans many (message, user) pairs
+        for reactor, emoji in ((members[(index + 1) % 3], "👍"), (members[(index + 2) % 3], "🎉")):
+            client.post(f"/api/messages/{message['id']}/reactions", json={
+                "emoji": emoji, "message_id": message["id"]
+            }, headers=reactor)
+
+    history_cache.clear()
+    return {"room_id": room_id, "owner": owner, "members": members}
@@ -0,0 +1,52 @@
+"""Garbage collection must not unlink an object another worker has just stored again."""
+import asyncio
+import hashlib
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import get_settings
+from app.core.attachments import OBJECTS_DIR, collect_garbage, release_attachment, store_attachment
+from app.core.uploads import ReceivedUpload
+from conftest import TEST_DATABASE
+
+CONTENT = b"shared attachment bytes"
+
+def received_upload(name: str) -> ReceivedUpload:
+    # Temp files sit in the objects directory, as receive_upload leaves them
+    directory = Path(get_settings().upload_dir) / OBJECTS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    temp_path = directory / f".upload-{name}"
+    temp_path.write_bytes(CONTENT)
+    return ReceivedUpload(temp_path, len(CONTENT), hashlib.sha256(CONTENT).hexdigest())
+
+def test_collect_skips_object_stored_again(client):
+    async def scenario():
+        # Two sessions standing in for two workers sharing the database and upload directory
+        engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE}")
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with sessions() as first, sessions() as second:
+                attachment = await store_attachment(first, received_upload("a"), ".txt")
+                stored = Path(get_settings().upload_dir) / attachment.storage_path
+
+                # First worker drops the last reference and commits...
+                released = await release_attachment(first, attachment.id)
+                await first.commit()
+                # ...the second stores the same bytes under the same path before it collects
+                await store_attachment(second, received_upload("b"), ".txt")
+                await collect_garbage(first, released)
+                survived = stored.exists()
+
+                attachment_id = (await store_attachment(second, received_upload("c"), ".txt")).id
+                for _ in range(2):
+                    released = await release_attachment(second, attachment_id)
+                    await second.commit()
+                    await collect_garbage(second, released)
+                return survived, stored.exists()
+        finally:
+            await engine.dispose()
+
+    survived, left_behind = asyncio.run(scenario())
+    assert survived
+    assert not left_behind
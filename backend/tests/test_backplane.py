@@ -0,0 +1,45 @@
+"""Room frames must cross the Unix socket backplane whatever their size, up to the cap."""
+import asyncio
+import os
+import sys
+
+import pytest
+
+from app.core.backplane import MAX_EVENT_BYTES, UnixSocketBackplane
+
+ROOM_ID = 7
+
+async def relay(socket_path: str, frames):
+    received = []
+    delivered = asyncio.Event()
+
+    async def on_frame(room_id, frame, exclude_user):
+        received.append(frame)
+        if len(received) == len(frames):
+            delivered.set()
+
+    async def ignore(room_id, frame, exclude_user):
+        pass
+
+    publisher, subscriber = UnixSocketBackplane(socket_path), UnixSocketBackplane(socket_path)
+    await publisher.start(ignore)
+    await subscriber.start(on_frame)
+    try:
+        subscriber.subscribe(ROOM_ID)
+        while publisher.writer is None or subscriber.writer is None:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)  # let the broker register the subscription
+        for frame in frames:
+            publisher.publish(ROOM_ID, frame)
+        await asyncio.wait_for(delivered.wait(), timeout=5)
+    finally:
+        await subscriber.stop()
+        await publisher.stop()
+    return received
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs Unix sockets")
+def test_frames_past_default_stream_limit_are_delivered(tmp_path):
+    frames = ["x" * 1000, "y" * 70000, '"\\' * 100000, "z"]
+    received = asyncio.run(relay(os.path.join(tmp_path, "backplane.sock"), frames))
+    assert received == frames
+    assert len(frames[2]) * 4 < MAX_EVENT_BYTES
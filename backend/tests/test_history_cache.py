@@ -0,0 +1,38 @@
+"""A history read racing a message write must not leave the cached page with duplicates."""
+from app.core.history_cache import HistoryCache
+
+ROOM_ID = 1
+
+def message(message_id: int) -> dict:
+    return {"id": message_id, "user_id": 1, "content": f"message {message_id}", "reactions": []}
+
+def reaction(reaction_id: int) -> dict:
+    return {"id": reaction_id, "emoji": "👍", "user_id": 2, "username": "bobby"}
+
+def cached_ids(cache: HistoryCache):
+    return [msg["id"] for msg in cache.latest(ROOM_ID, 10)]
+
+def test_fill_read_before_write_is_discarded():
+    cache = HistoryCache(room_messages=50, max_bytes=1 << 20)
+    version = cache.version(ROOM_ID)  # history read starts
+    cache.invalidate(ROOM_ID)  # write path, before its commit
+    # The read's query ran after the commit and already sees message 5
+    cache.fill(ROOM_ID, [message(4), message(5)], complete=True, version=version)
+    cache.append(ROOM_ID, message(5))  # write path resumes
+    assert cache.latest(ROOM_ID, 10) is None
+
+def test_append_skips_message_already_filled():
+    cache = HistoryCache(room_messages=50, max_bytes=1 << 20)
+    cache.invalidate(ROOM_ID)
+    # The read started after invalidate, and its query ran after the commit
+    cache.fill(ROOM_ID, [message(4), message(5)], complete=True, version=cache.version(ROOM_ID))
+    cache.append(ROOM_ID, message(5))
+    assert cached_ids(cache) == [4, 5]
+
+def test_add_reaction_skips_reaction_already_filled():
+    cache = HistoryCache(room_messages=50, max_bytes=1 << 20)
+    cache.invalidate(ROOM_ID)
+    filled = dict(message(5), reactions=[reaction(9)])
+    cache.fill(ROOM_ID, [filled], complete=True, version=cache.version(ROOM_ID))
+    cache.add_reaction(ROOM_ID, 5, reaction(9))
+    assert [r["id"] for r in cache.latest(ROOM_ID, 10)[0]["reactions"]] == [9]
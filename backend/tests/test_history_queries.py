@@ -0,0 +1,34 @@
+"""A room history page must cost a fixed number of statements, whatever its size."""
+from app.core.history_cache import history_cache
+from conftest import SEED_MESSAGES, record_statements
+
+# Messages with their authors in one query, every reaction on the page with its username in another
+HISTORY_PAGE_STATEMENT_BUDGET = 2
+
+def fetch_page(client, room, **params):
+    # The latest page is normally served from memory; these tests measure the database path
+    history_cache.clear()
+    with record_statements() as log:
+        response = client.get(f"/api/rooms/{room['room_id']}/messages", params=params, headers=room["owner"])
+    assert response.status_code == 200, response.text
+    return response, log
+
+def test_latest_page_within_statement_budget(client, seeded_room):
+    client.get("/api/users/me", headers=seeded_room["owner"])  # warm the auth cache
+    response, log = fetch_page(client, seeded_room, limit=50)
+    page = response.json()
+    assert len(page) == 50
+    assert all(len(message["reactions"]) == 2 for message in page)
+    assert all(reaction["username"] != "Unknown" for message in page for reaction in message["reactions"])
+    assert len(log) <= HISTORY_PAGE_STATEMENT_BUDGET, log.statements
+
+def test_older_page_within_statement_budget(client, seeded_room):
+    latest, _ = fetch_page(client, seeded_room, limit=20)
+    response, log = fetch_page(client, seeded_room, limit=20, cursor=latest.headers["X-Next-Cursor"])
+    assert len(response.json()) == 20
+    assert len(log) <= HISTORY_PAGE_STATEMENT_BUDGET, log.statements
+
+def test_statement_count_does_not_grow_with_page_size(client, seeded_room):
+    _, small = fetch_page(client, seeded_room, limit=5)
+    _, large = fetch_page(client, seeded_room, limit=SEED_MESSAGES)
+    assert len(small) == len(large)
@@ -0,0 +1,50 @@
+"""A user's offline diff must reach their rooms however their last connection was removed."""
+import asyncio
+
+from app.core.presence import PresenceRegistry
+from app.core.websocket_manager import ConnectionManager
+
+USER_ID = 11
+ROOM_ID = 3
+
+class StubWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: str):
+        pass
+
+    async def close(self, code: int):
+        pass
+
+def test_slow_consumer_drop_keeps_rooms_for_offline_diff():
+    async def scenario():
+        manager = ConnectionManager()
+        presence = PresenceRegistry(manager)
+        connection = await manager.connect(StubWebSocket(), USER_ID, "dave")
+        await manager.join_room(connection, ROOM_ID)
+
+        await manager.drop_slow_consumer(connection)
+        # The receive loop then exits and disconnects the same connection again
+        assert await manager.disconnect(connection) is False
+        await asyncio.sleep(0)  # let the close task run
+        return presence
+
+    presence = asyncio.run(scenario())
+    assert presence.is_online(USER_ID, default=True) is False
+    assert presence.pending_rooms[USER_ID] == {ROOM_ID}
+
+def test_other_devices_keep_user_online():
+    async def scenario():
+        manager = ConnectionManager()
+        presence = PresenceRegistry(manager)
+        first = await manager.connect(StubWebSocket(), USER_ID, "dave")
+        second = await manager.connect(StubWebSocket(), USER_ID, "dave")
+        await manager.disconnect(first)
+        connected = USER_ID in presence.pending
+        await manager.disconnect(second)
+        return connected, presence
+
+    connected, presence = asyncio.run(scenario())
+    assert connected is False
+    assert presence.is_online(USER_ID, default=True) is False
@@ -0,0 +1,57 @@
+"""Hot router queries must be index lookups, not full scans of the big tables."""
+import re
+import sqlite3
+
+from conftest import TEST_DATABASE, record_statements, register
+
+INDEXED_TABLES = ("messages", "reactions", "room_members", "room_invites")
+FULL_SCAN = re.compile(r"\bSCAN (%s)\b" % "|".join(INDEXED_TABLES))
+
+def explain(statement: str, parameters) -> list:
+    connection = sqlite3.connect(TEST_DATABASE)
+    try:
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+    finally:
+        connection.close()
+    return [row[-1] for row in rows]
+
+def hot_statements(client, room) -> list:
+    """Every read/update/delete the hot endpoints issue, with the parameters they used."""
+    owner, invitee = room["owner"], register(client, "dave")
+    room_id = room["room_id"]
+    private_id = client.post("/api/rooms/", json={
+        "name": "private", "description": "", "room_type": "private"
+    }, headers=owner).json()["id"]
+    invitee_id = client.get("/api/users/me", headers=invitee).json()["id"]
+
+    with record_statements() as log:
+        client.get("/api/rooms/", headers=owner)
+        latest = client.get(f"/api/rooms/{room_id}/messages", params={"limit": 20}, headers=owner)
+        client.get(f"/api/rooms/{room_id}/messages", params={
+            "limit": 20, "cursor": latest.headers["X-Next-Cursor"]
+        }, headers=owner)
+        message = client.post("/api/messages/", json={"content": "plan check", "room_id": room_id}, headers=owner).json()
+        for _ in range(2):  # add, then toggle off
+            client.post(f"/api/messages/{message['id']}/reactions", json={
+                "emoji": "👀", "message_id": message["id"]
+            }, headers=owner)
+        client.delete(f"/api/messages/{message['id']}", headers=owner)
+        client.post(f"/api/rooms/{room_id}/join", headers=invitee)
+        client.post(f"/api/rooms/{private_id}/invite", json={"user_id": invitee_id}, headers=owner)
+        invite_id = client.get("/api/rooms/invites", headers=invitee).json()[0]["id"]
+        client.post(f"/api/rooms/invites/{invite_id}/accept", headers=invitee)
+        client.get(f"/api/rooms/{room_id}/search", params={"q": "seed"}, headers=owner)
+    return [
+        (statement, parameters) for statement, parameters in log.statements
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE")
+    ]
+
+def test_hot_queries_use_indexes(client, seeded_room):
+    statements = hot_statements(client, seeded_room)
+    assert statements
+    scans = []
+    for statement, parameters in statements:
+        plan = explain(statement, parameters)
+        if any(FULL_SCAN.search(step) for step in plan):
+            scans.append((statement, plan))
+    assert not scans, "\n\n".join(f"{statement}\n{plan}" for statement, plan in scans)
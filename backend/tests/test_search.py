@@ -0,0 +1,15 @@
+"""Search snippets are HTML: message text in them must be escaped around the <mark> hits."""
+from app.core.search import highlight_snippet
+
+def test_snippet_escapes_message_markup(client, seeded_room):
+    room_id = seeded_room["room_id"]
+    content = 'hello <img src=x onerror=alert(1)> & "deploy"'
+    response = client.post("/api/messages/", json={"content": content, "room_id": room_id}, headers=seeded_room["owner"])
+    assert response.status_code == 200, response.text
+
+    hits = client.get(f"/api/rooms/{room_id}/search", params={"q": "deploy"}, headers=seeded_room["owner"]).json()
+    assert [hit["content"] for hit in hits] == [content]
+    assert hits[0]["snippet"] == "hello &lt;img src=x onerror=alert(1)&gt; &amp; &quot;<mark>deploy</mark>&quot;"
+
+def test_highlight_snippet_keeps_only_mark_tags():
+    assert highlight_snippet("<b>\x02ship\x03</b> it") == "&lt;b&gt;<mark>ship</mark>&lt;/b&gt; it"
@@ -80,6 +80,16 @@ const ChatWindow = ({ room, onToggleSidebar }) => {
     }
   }, [room?.id]);
 
+  // Thumbnails arrive after the upload, once the server has rendered them
+  const handleMessageUpdated = useCallback((data) => {
+    if (data.message_id && data.room_id === room?.id) {
+      const { type, room_id, message_id, ...fields } = data;
+      setMessages(prev =>
+        prev.map(msg => (msg.id === message_id ? { ...msg, ...fields } : msg))
+      );
+    }
+  }, [room?.id]);
+
   const handleMessageDeleted = useCallback((data) => {
     if (data.message_id && data.room_id === room?.id) {
       setMessages(prev => prev.filter(msg => msg.id !== data.message_id));
@@ -91,14 +101,16 @@ const ChatWindow = ({ room, onToggleSidebar }) => {
     const unsubscribeTyping = subscribeToEvent('typing', handleTyping);
     const unsubscribeReaction = subscribeToEvent('message_reaction', handleReaction);
     const unsubscribeDeleted = subscribeToEvent('message_deleted', handleMessageDeleted);
+    const unsubscribeUpdated = subscribeToEvent('message_updated', handleMessageUpdated);
 
     return () => {
       unsubscribeMessage();
       unsubscribeTyping();
       unsubscribeReaction();
       unsubscribeDeleted();
+      unsubscribeUpdated();
     };
-  }, [subscribeToEvent, handleNewMessage, handleTyping, handleReaction, handleMessageDeleted]);
+  }, [subscribeToEvent, handleNewMessage, handleTyping, handleReaction, handleMessageDeleted, handleMessageUpdated]);
 
   useEffect(() => {
     scrollToBottom();
@@ -7,6 +7,9 @@ import { useWebSocket } from '../../hooks/useWebSocket';
 import toast from 'react-hot-toast';
 import './MessageInput.css';
 
+const TYPING_REFRESH_MS = 3000;
+const MAX_MESSAGE_LENGTH = 10000; // same cap as MessageCreate on the server
+
 const MessageInput = ({ roomId }) => {
   const [message, setMessage] = useState('');
   const [showEmojiPicker, setShowEmojiPicker] = useState(false);
@@ -16,6 +19,7 @@ const MessageInput = ({ roomId }) => {
   const inputRef = useRef(null);
   const fileInputRef = useRef(null);
   const typingTimeoutRef = useRef(null);
+  const lastTypingSentRef = useRef(0);
   const { sendTyping } = useWebSocket();
 
   useEffect(() => {
@@ -30,9 +34,13 @@ const MessageInput = ({ roomId }) => {
     const value = e.target.value;
     setMessage(value);
 
-    if (value && !isTyping) {
+    // Re-send while typing continues: the server expires a flag that isn't refreshed
+    // (typing_timeout_seconds, 6s), so a long burst would otherwise drop out mid-message
+    const now = Date.now();
+    if (value && (!isTyping || now - lastTypingSentRef.current > TYPING_REFRESH_MS)) {
       setIsTyping(true);
       sendTyping(roomId, true);
+      lastTypingSentRef.current = now;
     }
 
     if (typingTimeoutRef.current) {
@@ -160,6 +168,7 @@ const MessageInput = ({ roomId }) => {
           onKeyPress={handleKeyPress}
           placeholder={selectedFile ? "Add a caption (optional)" : "Type a message..."}
           rows="1"
+          maxLength={MAX_MESSAGE_LENGTH}
           className="message-textarea"
           disabled={uploading}
         />
@@ -100,10 +100,13 @@ const MessageItem = ({ message, index }) => {
             <div className="message-file">
               {message.file_url && isImage(message.file_name) ? (
                 <img 
-                  src={`${API_URL}${message.file_url}`} 
+                  src={`${API_URL}${message.thumbnail_url || message.file_url}`} 
+                  width={message.thumbnail_width || undefined}
+                  height={message.thumbnail_height || undefined}
                   alt={message.file_name}
                   className="message-image"
-                  onClick={() => window.open(`${API_URL}${message.file_url}`, '_blank')}
+                  loading="lazy"
+                  onClick={() => window.open(`${API_URL}${message.preview_url || message.file_url}`, '_blank')}
                 />
               ) : (
                 <div className="file-attachment">
@@ -1,22 +1,26 @@
 import React, { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { FiX, FiUserPlus } from 'react-icons/fi';
-import { getAllUsers, inviteToRoom } from '../../services/api';
+import { getAllUsers, searchUsers, inviteToRoom } from '../../services/api';
 import toast from 'react-hot-toast';
 import Avatar from '../Common/Avatar';
+import SearchBar from '../Common/SearchBar';
 import './RoomSettings.css';
 
 const RoomSettings = ({ room, onClose }) => {
   const [users, setUsers] = useState([]);
+  const [query, setQuery] = useState('');
   const [loading, setLoading] = useState(true);
 
+  // The server filters by username/full-name prefix; wait for a pause in typing
   useEffect(() => {
-    loadUsers();
-  }, []);
+    const timer = setTimeout(() => loadUsers(query.trim()), query ? 250 : 0);
+    return () => clearTimeout(timer);
+  }, [query]);
 
-  const loadUsers = async () => {
+  const loadUsers = async (q) => {
     try {
-      const response = await getAllUsers();
+      const response = q ? await searchUsers(q) : await getAllUsers({ limit: 20 });
       // Filter out users already in the room
       const availableUsers = response.data.filter(
         user => !room.members?.includes(user.id)
@@ -62,6 +66,8 @@ const RoomSettings = ({ room, onClose }) => {
             </button>
           </div>
 
+          <SearchBar value={query} onChange={setQuery} placeholder="Search users..." />
+
           <div className="users-to-invite">
             {loading ? (
               <div className="loading-state">Loading users...</div>
@@ -77,7 +83,6 @@ const RoomSettings = ({ room, onClose }) => {
                   <Avatar user={user} size="md" />
                   <div className="user-info">
                     <h4>{user.username}</h4>
-                    <p>{user.email}</p>
                   </div>
                   <button
                     className="invite-user-btn"
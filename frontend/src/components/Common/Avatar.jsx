@@ -30,7 +30,8 @@ const Avatar = ({ user, size = 'md', showOnline = true, onClick }) => {
     return `${API_URL}${url}`;
   };
 
-  const avatarSrc = getAvatarUrl(user.avatar_url);
+  // The 96px square thumbnail covers every size up to lg; it appears once the server has rendered it
+  const avatarSrc = getAvatarUrl((size !== 'xl' && user.avatar_thumbnail_url) || user.avatar_url);
 
   return (
     <div 
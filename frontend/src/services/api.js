@@ -44,7 +44,9 @@ export const register = (username, email, password, fullName) =>
 
 // Users
 export const getCurrentUser = () => api.get('/api/users/me');
-export const getAllUsers = () => api.get('/api/users');
+export const getAllUsers = (params) => api.get('/api/users', { params });
+export const searchUsers = (q, params) =>
+  api.get('/api/users/search', { params: { q, ...params } });
 
 // Rooms
 export const getRooms = () => api.get('/api/rooms');